@@ -1,6 +1,11 @@
-from src import *
+import sys
 
 def __main__():
+    # Any command line arguments select the non-interactive batch mode
+    if len(sys.argv) > 1:
+        from src.Headless import runHeadless
+        sys.exit(runHeadless())
+    from src.CLI import Interface
     Interface()
     
 if __name__ == "__main__":
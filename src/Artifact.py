@@ -0,0 +1,165 @@
+"""
+Pre-baked single file model artifact
+The prototxt and the caffemodel are stored in one file, with the cluster centers (class8_ab)
+and the rebalancing factor (conv8_313_rh) already written into the caffemodel, so loading
+the network is a single file read without the .npy file and without patching layer blobs.
+The header also keeps the model fingerprint used by the result cache.
+"""
+
+import json
+import struct
+import numpy as np
+import cv2 as cv
+from .Cache import modelFingerprint
+
+# First bytes of every artifact file
+magic = b"COLORIZATION-ARTIFACT\n"
+artifactVersion = 1
+
+# Function to read a protobuf varint at offset, returns (value, next offset)
+def readVarint(buffer, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+# Function to encode an unsigned integer as a protobuf varint
+def encodeVarint(value):
+    encoded = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            encoded.append(byte | 0x80)
+        else:
+            encoded.append(byte)
+            return bytes(encoded)
+
+# Function to encode a length delimited protobuf field
+def encodeField(fieldNumber, payload):
+    return encodeVarint(fieldNumber << 3 | 2) + encodeVarint(len(payload)) + payload
+
+# Function to encode a Caffe BlobProto with its shape and packed float data
+def encodeBlob(blob):
+    shape = encodeField(1, b"".join(encodeVarint(dim) for dim in blob.shape))
+    return encodeField(7, shape) + encodeField(5, np.ascontiguousarray(blob, "<f4").tobytes())
+
+# Function to split a protobuf message into (field number, raw field bytes, payload) tuples
+# payload is the content of length delimited fields, the value of varints and the bytes of fixed size fields
+def splitFields(buffer):
+    fields = []
+    offset = 0
+    while offset < len(buffer):
+        start = offset
+        key, offset = readVarint(buffer, offset)
+        fieldNumber, wireType = key >> 3, key & 7
+        if wireType == 0:
+            payload, offset = readVarint(buffer, offset)
+        elif wireType == 1:
+            payload = buffer[offset:offset + 8]
+            offset += 8
+        elif wireType == 2:
+            length, offset = readVarint(buffer, offset)
+            payload = buffer[offset:offset + length]
+            offset += length
+        elif wireType == 5:
+            payload = buffer[offset:offset + 4]
+            offset += 4
+        else:
+            raise ValueError(f"Unsupported protobuf wire type {wireType}")
+        fields.append((fieldNumber, buffer[start:offset], payload))
+    return fields
+
+# Function to return the name of an encoded LayerParameter
+def layerName(payload):
+    for fieldNumber, raw, value in splitFields(payload):
+        if fieldNumber == 1:
+            return bytes(value).decode()
+    return None
+
+# Function to write the cluster centers and the rebalancing factor into the binary caffemodel
+def patchCaffemodel(caffemodel, clusterPath):
+    fields = splitFields(memoryview(caffemodel))
+    # Old V1 "layers" models would have to be upgraded first, they are patched when loading instead
+    if any(fieldNumber == 2 for fieldNumber, raw, payload in fields):
+        return caffemodel, False
+
+    pts_in_hull = np.load(clusterPath).transpose().reshape(2, 313, 1, 1).astype("float32")
+    patchedBlobs = {
+        "class8_ab": ("Convolution", pts_in_hull),
+        "conv8_313_rh": ("Scale", np.full([1, 313], 2.606, "float32"))
+    }
+    parts = []
+    for fieldNumber, raw, payload in fields:
+        if fieldNumber == 100 and layerName(payload) in patchedBlobs:
+            continue
+        parts.append(bytes(raw))
+    for name, (layerType, blob) in patchedBlobs.items():
+        parts.append(encodeField(100, encodeField(1, name.encode()) + encodeField(2, layerType.encode()) + encodeField(7, encodeBlob(blob))))
+    return b"".join(parts), True
+
+# Function to bake the model files into a single artifact file
+def bakeArtifact(outputFile, modelPath, prototxtPath, clusterPath):
+    with open(prototxtPath, "rb") as file:
+        prototxt = file.read()
+    with open(modelPath, "rb") as file:
+        caffemodel = file.read()
+    caffemodel, patched = patchCaffemodel(caffemodel, clusterPath)
+    clusterCenters = b"" if patched else np.load(clusterPath).astype("<f4").tobytes()
+
+    header = json.dumps({
+        "version": artifactVersion,
+        "patched": patched,
+        "fingerprint": modelFingerprint(modelPath, prototxtPath, clusterPath),
+        "sections": {"prototxt": len(prototxt), "caffemodel": len(caffemodel), "clusterCenters": len(clusterCenters)}
+    }).encode()
+    with open(outputFile, "wb") as outputfile:
+        outputfile.write(magic + struct.pack("<Q", len(header)) + header)
+        outputfile.write(prototxt)
+        outputfile.write(caffemodel)
+        outputfile.write(clusterCenters)
+    return outputFile
+
+# Function to parse the header at the start of an artifact, returns (header, offset of the first section)
+def parseHeader(buffer, artifactFile):
+    if not buffer.startswith(magic):
+        raise ValueError(f"Not a colorization artifact: {artifactFile}")
+    offset = len(magic)
+    headerLength, = struct.unpack_from("<Q", buffer, offset)
+    offset += 8
+    header = json.loads(buffer[offset:offset + headerLength])
+    if header["version"] != artifactVersion:
+        raise ValueError(f"Unsupported artifact version {header['version']}: {artifactFile}")
+    return header, offset + headerLength
+
+# Function to read only the header of an artifact file (fingerprint, sections)
+def readArtifactHeader(artifactFile):
+    with open(artifactFile, "rb") as file:
+        prefix = file.read(len(magic) + 8)
+        if len(prefix) < len(magic) + 8:
+            raise ValueError(f"Not a colorization artifact: {artifactFile}")
+        headerLength, = struct.unpack_from("<Q", prefix, len(magic))
+        return parseHeader(prefix + file.read(headerLength), artifactFile)[0]
+
+# Function to load the network of an artifact file, returns (net, fingerprint)
+def loadArtifact(artifactFile):
+    with open(artifactFile, "rb") as file:
+        buffer = file.read()
+    header, offset = parseHeader(buffer, artifactFile)
+
+    sections = {}
+    for name, length in header["sections"].items():
+        sections[name] = np.frombuffer(buffer, "uint8", length, offset)
+        offset += length
+
+    net = cv.dnn.readNetFromCaffe(sections["prototxt"], sections["caffemodel"])
+    if not header["patched"]:
+        pts_in_hull = sections["clusterCenters"].view("<f4").reshape(313, 2).transpose().reshape(2, 313, 1, 1)
+        net.getLayer(net.getLayerId("class8_ab")).blobs = [pts_in_hull.astype("float32")]
+        net.getLayer(net.getLayerId("conv8_313_rh")).blobs = [np.full([1, 313], 2.606, "float32")]
+    return net, header["fingerprint"]
@@ -0,0 +1,246 @@
+"""
+Pluggable inference backends running the colorization network
+A backend is loaded from the model files, forwards an Nx1xHxW blob of mean-centered L channels
+to the Nx2x(H/4)x(W/4) AB result of class8_ab and describes itself for reports. The OpenCV DNN
+backend runs the Caffe network; the NumPy backend is a reference implementation of the small
+layer set of the benchmark stand-in network (Convolution, ReLU, Scale, Softmax), useful to test
+and compare without the 130MB caffemodel. Other engines are added with registerBackend.
+"""
+
+import re
+import cv2 as cv
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from .Artifact import loadArtifact, readVarint, splitFields
+
+# DNN backends and targets of the OpenCV backend selectable in settings.json, by name
+backends = {
+    "default": "DNN_BACKEND_DEFAULT",
+    "opencv": "DNN_BACKEND_OPENCV",
+    "openvino": "DNN_BACKEND_INFERENCE_ENGINE",
+    "cuda": "DNN_BACKEND_CUDA",
+    "vulkan": "DNN_BACKEND_VKCOM"
+}
+targets = {
+    "cpu": "DNN_TARGET_CPU",
+    "cpu_fp16": "DNN_TARGET_CPU_FP16",
+    "opencl": "DNN_TARGET_OPENCL",
+    "opencl_fp16": "DNN_TARGET_OPENCL_FP16",
+    "cuda": "DNN_TARGET_CUDA",
+    "cuda_fp16": "DNN_TARGET_CUDA_FP16",
+    "vulkan": "DNN_TARGET_VULKAN"
+}
+
+# Function to return the OpenCV constant of a backend or target name
+def dnnConstant(names, name):
+    if name not in names or not hasattr(cv.dnn, names[name]):
+        raise ValueError(f"Unsupported DNN option: {name} (available: {', '.join(key for key in names if hasattr(cv.dnn, names[key]))})")
+    return getattr(cv.dnn, names[name])
+
+# Function to return the blobs injected into class8_ab (cluster centers) and conv8_313_rh (rebalancing factor)
+def injectedBlobs(clusterPath):
+    # Populate the ab cluster centers as 1x1 convolution kernel
+    pts_in_hull = np.load(clusterPath).transpose().reshape(2, 313, 1, 1).astype("float32")
+    return {
+        "class8_ab": [pts_in_hull],
+        "conv8_313_rh": [np.full([1, 313], 2.606, "float32")]
+    }
+
+# Interface of the inference backends
+class InferenceBackend:
+
+    name = None
+    # Fingerprint of the loaded model when known without hashing the files (artifacts)
+    fingerprint = None
+
+    # Function to select the device options of the backend, ignored by backends without any
+    def configure(self, backend = None, target = None, threads = None):
+        pass
+
+    # Function to forward an Nx1xHxW float32 blob, returns the Nx2xhxw AB result
+    def forward(self, blob):
+        raise NotImplementedError
+
+    # Function to describe the backend and its options
+    def describe(self):
+        return {"name": self.name}
+
+class OpenCVBackend(InferenceBackend):
+
+    name = "opencv"
+
+    def __init__(self, modelPath, prototxtPath, clusterPath, artifactFile = ""):
+        if artifactFile:
+            # Single file read, the blobs are already baked into the model
+            self.net, self.fingerprint = loadArtifact(artifactFile)
+        else:
+            # Using OpenCV's Deep Neural Network Module to load the model
+            self.net = cv.dnn.readNetFromCaffe(prototxtPath, modelPath)
+            for layerName, blobs in injectedBlobs(clusterPath).items():
+                self.net.getLayer(self.net.getLayerId(layerName)).blobs = blobs
+        self.backend = self.target = self.threads = None
+
+    # Function to select the DNN backend, target and OpenCV thread count (0: OpenCV default)
+    # The thread count is shared by the whole process, keep threads x processes <= cores
+    def configure(self, backend = None, target = None, threads = None):
+        if backend is not None and backend != self.backend:
+            self.net.setPreferableBackend(dnnConstant(backends, backend))
+            self.backend = backend
+        if target is not None and target != self.target:
+            self.net.setPreferableTarget(dnnConstant(targets, target))
+            self.target = target
+        if threads is not None and threads != self.threads:
+            cv.setNumThreads(threads if threads > 0 else -1)
+            self.threads = threads
+
+    def forward(self, blob):
+        self.net.setInput(blob)
+        return self.net.forward()
+
+    def describe(self):
+        return {"name": self.name, "backend": self.backend, "target": self.target, "threads": cv.getNumThreads(), "opencv": cv.__version__}
+
+# Function to parse a protobuf text file (.prototxt) into nested lists of (key, value) pairs
+def parsePrototxt(text):
+    text = re.sub(r"#[^\n]*", "", text)
+    tokens = re.findall(r"\"[^\"]*\"|'[^']*'|[{}:]|[^\s{}:\"']+", text)
+    root = []
+    stack = [root]
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token == "}":
+            stack.pop()
+            i += 1
+        elif i + 1 < len(tokens) and tokens[i + 1] == ":" and tokens[i + 2] != "{":
+            stack[-1].append((token, tokens[i + 2].strip("\"'")))
+            i += 3
+        else:
+            # "key {" or "key: {"
+            message = []
+            stack[-1].append((token, message))
+            stack.append(message)
+            i += 3 if tokens[i + 1] == ":" else 2
+    return root
+
+# Function to return the first value of a key in a parsed message, default when missing
+def field(message, key, default = None):
+    for name, value in message:
+        if name == key:
+            return value
+    return default
+
+# Function to decode a Caffe BlobProto into a float32 array
+def decodeBlob(payload):
+    shape = []
+    legacyShape = {}
+    data = []
+    for fieldNumber, raw, value in splitFields(payload):
+        if fieldNumber == 7:
+            for dimField, dimRaw, dim in splitFields(value):
+                if isinstance(dim, int):
+                    shape.append(dim)
+                else:
+                    # Packed dimensions
+                    offset = 0
+                    while offset < len(dim):
+                        dimension, offset = readVarint(dim, offset)
+                        shape.append(dimension)
+        elif fieldNumber == 5:
+            data.append(np.frombuffer(value, "<f4"))
+        elif fieldNumber in (1, 2, 3, 4):
+            legacyShape[fieldNumber] = value
+    if not shape:
+        shape = [legacyShape.get(number, 1) for number in (1, 2, 3, 4)]
+    return np.concatenate(data).astype("float32").reshape(shape)
+
+# Function to read the blobs of every layer of a binary .caffemodel, keyed by layer name
+def readCaffemodelBlobs(modelPath):
+    with open(modelPath, "rb") as file:
+        caffemodel = file.read()
+    layerBlobs = {}
+    for fieldNumber, raw, payload in splitFields(memoryview(caffemodel)):
+        if fieldNumber == 2:
+            raise ValueError(f"V1 layers are not supported by the NumPy backend: {modelPath}")
+        if fieldNumber != 100:
+            continue
+        name, blobs = None, []
+        for layerField, layerRaw, value in splitFields(payload):
+            if layerField == 1:
+                name = bytes(value).decode()
+            elif layerField == 7:
+                blobs.append(decodeBlob(value))
+        layerBlobs[name] = blobs
+    return layerBlobs
+
+# Function to run a Caffe convolution (single group) on an NxCxHxW array
+def convolution(inputs, weights, bias, stride, pad, dilation):
+    outputChannels, inputChannels, kernelHeight, kernelWidth = weights.shape
+    if pad > 0:
+        inputs = np.pad(inputs, ((0, 0), (0, 0), (pad, pad), (pad, pad)))
+    if kernelHeight == kernelWidth == 1:
+        outputs = np.tensordot(weights[:, :, 0, 0], inputs[:, :, ::stride, ::stride], axes = ([1], [1])).transpose(1, 0, 2, 3)
+    else:
+        windowShape = ((kernelHeight - 1) * dilation + 1, (kernelWidth - 1) * dilation + 1)
+        windows = sliding_window_view(inputs, windowShape, axis = (2, 3))[:, :, ::stride, ::stride, ::dilation, ::dilation]
+        outputs = np.einsum("nchwij,ocij->nohw", windows, weights, optimize = True)
+    if bias is not None:
+        outputs += bias.reshape(1, -1, 1, 1)
+    return outputs
+
+class NumPyBackend(InferenceBackend):
+
+    name = "numpy"
+    # Layer types the reference implementation can run
+    layerTypes = ["Input", "Convolution", "ReLU", "Scale", "Softmax", "Silence"]
+
+    def __init__(self, modelPath, prototxtPath, clusterPath, artifactFile = ""):
+        with open(prototxtPath) as file:
+            self.layers = [layer for key, layer in parsePrototxt(file.read()) if key == "layer"]
+        unsupported = sorted({field(layer, "type") for layer in self.layers} - set(self.layerTypes))
+        if unsupported:
+            raise ValueError(f"Layer types not supported by the NumPy backend: {', '.join(unsupported)}")
+        self.blobs = readCaffemodelBlobs(modelPath)
+        self.blobs.update(injectedBlobs(clusterPath))
+
+    def forward(self, blob):
+        values = {}
+        for layer in self.layers:
+            layerType = field(layer, "type")
+            name = field(layer, "name")
+            bottom = field(layer, "bottom")
+            top = field(layer, "top")
+            blobs = self.blobs.get(name, [])
+            if layerType == "Input":
+                values[top] = blob.astype("float32", copy = False)
+            elif layerType == "Convolution":
+                parameters = field(layer, "convolution_param", [])
+                values[top] = convolution(values[bottom], blobs[0], blobs[1] if len(blobs) > 1 else None,
+                                          int(field(parameters, "stride", 1)), int(field(parameters, "pad", 0)), int(field(parameters, "dilation", 1)))
+            elif layerType == "ReLU":
+                values[top] = np.maximum(values[bottom], 0)
+            elif layerType == "Scale":
+                values[top] = values[bottom] * blobs[0].reshape(1, -1, 1, 1)
+            elif layerType == "Softmax":
+                exponentials = np.exp(values[bottom] - values[bottom].max(axis = 1, keepdims = True))
+                values[top] = exponentials / exponentials.sum(axis = 1, keepdims = True)
+        return values["class8_ab"]
+
+    def describe(self):
+        return {"name": self.name, "layers": len(self.layers), "numpy": np.__version__}
+
+# Inference backends selectable with inferenceBackend in settings.json, by name
+inferenceBackends = {
+    "opencv": OpenCVBackend,
+    "numpy": NumPyBackend
+}
+
+# Function to add an inference backend, backendClass(modelPath, prototxtPath, clusterPath, artifactFile) implements InferenceBackend
+def registerBackend(name, backendClass):
+    inferenceBackends[name] = backendClass
+
+# Function to load the named inference backend
+def loadBackend(name, modelPath, prototxtPath, clusterPath, artifactFile = ""):
+    if name not in inferenceBackends:
+        raise ValueError(f"Unknown inference backend: {name} (available: {', '.join(inferenceBackends)})")
+    return inferenceBackends[name](modelPath, prototxtPath, clusterPath, artifactFile)
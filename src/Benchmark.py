@@ -0,0 +1,214 @@
+"""
+Reproducible benchmark of the colorization pipeline
+Synthetic images and videos are generated at several resolutions and colorized with either the
+real Caffe network or a small generated stand-in network with the same data_l input and the same
+conv8_313 / conv8_313_rh / class8_313_rh / class8_ab layers. Throughput, latency percentiles and
+peak memory of every stage are reported as JSON so runs can be compared across commits.
+"""
+
+import json
+import platform
+import subprocess
+import tempfile
+import time
+from os import path, makedirs, cpu_count
+import cv2 as cv
+import numpy as np
+from .Artifact import encodeBlob, encodeField
+from .Engine import ColorizationEngine
+from .Pipeline import VideoPipeline
+
+# Cluster centers shipped with the repository, used by the stand-in network
+clusterPath = path.join(path.dirname(path.dirname(path.abspath(__file__))), "model", "pts_in_hull.npy")
+
+# Structure of the stand-in network, downscaling by 4 like the real network (224 -> 56)
+standInPrototxt = """name: "LtoAB_standin"
+layer { name: "data_l" type: "Input" top: "data_l" input_param { shape { dim: 1 dim: 1 dim: 224 dim: 224 } } }
+layer { name: "conv1" type: "Convolution" bottom: "data_l" top: "conv1" convolution_param { num_output: 16 kernel_size: 3 pad: 1 stride: 2 } }
+layer { name: "relu1" type: "ReLU" bottom: "conv1" top: "conv1" }
+layer { name: "conv2" type: "Convolution" bottom: "conv1" top: "conv2" convolution_param { num_output: 32 kernel_size: 3 pad: 1 stride: 2 } }
+layer { name: "relu2" type: "ReLU" bottom: "conv2" top: "conv2" }
+layer { name: "conv8_313" type: "Convolution" bottom: "conv2" top: "conv8_313" convolution_param { num_output: 313 kernel_size: 1 stride: 1 dilation: 1 } }
+layer { name: "conv8_313_rh" type: "Scale" bottom: "conv8_313" top: "conv8_313_rh" scale_param { bias_term: false filler { type: 'constant' value: 2.606 } } }
+layer { name: "class8_313_rh" type: "Softmax" bottom: "conv8_313_rh" top: "class8_313_rh" }
+layer { name: "class8_ab" type: "Convolution" bottom: "class8_313_rh" top: "class8_ab" convolution_param { num_output: 2 kernel_size: 1 stride: 1 dilation: 1 } }
+layer { name: "Silence" type: "Silence" bottom: "class8_ab" }
+"""
+
+# Weight shapes of the stand-in layers with learned parameters (weights, bias)
+standInBlobs = {
+    "conv1": [(16, 1, 3, 3), (16,)],
+    "conv2": [(32, 16, 3, 3), (32,)],
+    "conv8_313": [(313, 32, 1, 1), (313,)]
+}
+
+# Function to write the stand-in network (.prototxt and binary .caffemodel) with seeded random weights
+def createStandInModel(folder, seed = 0):
+    makedirs(folder, exist_ok = True)
+    prototxtPath = path.join(folder, "standin_deploy.prototxt")
+    modelPath = path.join(folder, "standin.caffemodel")
+    with open(prototxtPath, "w") as outputfile:
+        outputfile.write(standInPrototxt)
+
+    rng = np.random.default_rng(seed)
+    layers = []
+    for name, shapes in standInBlobs.items():
+        fanIn = int(np.prod(shapes[0][1:]))
+        blobs = [rng.standard_normal(shapes[0]) * np.sqrt(2 / fanIn), rng.standard_normal(shapes[1]) * 0.1]
+        payload = encodeField(1, name.encode()) + encodeField(2, b"Convolution")
+        payload += b"".join(encodeField(7, encodeBlob(blob)) for blob in blobs)
+        layers.append(encodeField(100, payload))
+    with open(modelPath, "wb") as outputfile:
+        outputfile.write(encodeField(1, b"LtoAB_standin") + b"".join(layers))
+
+    return modelPath, prototxtPath
+
+# Function to load the stand-in network or the Caffe model in settings.json without result cache
+def createEngine(network, batchSize, workFolder, inference = "opencv"):
+    if network == "standin":
+        modelPath, prototxtPath = createStandInModel(path.join(workFolder, "model"))
+        return ColorizationEngine(modelPath, prototxtPath, clusterPath, batchSize, "", "", inference)
+    return ColorizationEngine(batchSize = batchSize, cacheFolder = "", inferenceBackend = inference)
+
+# Function to generate a deterministic synthetic BGR image (gradients, shapes and noise)
+def syntheticImage(imageWidth, imageHeight, seed = 0):
+    rng = np.random.default_rng(seed)
+    gridX, gridY = np.meshgrid(np.linspace(0, 1, imageWidth, dtype = "float32"), np.linspace(0, 1, imageHeight, dtype = "float32"))
+    gray = 0.5 + 0.25 * np.sin(gridX * 12 + seed) * np.cos(gridY * 9)
+    image = np.repeat((gray * 255).astype("uint8")[:, :, np.newaxis], 3, axis = 2)
+    for i in range(8):
+        center = (int(rng.integers(imageWidth)), int(rng.integers(imageHeight)))
+        radius = int(rng.integers(max(2, min(imageWidth, imageHeight) // 12), max(3, min(imageWidth, imageHeight) // 4)))
+        cv.circle(image, center, radius, (int(rng.integers(256)),) * 3, -1)
+    noise = rng.integers(-8, 9, image.shape[:2])[:, :, np.newaxis]
+    return np.clip(image.astype("int16") + noise, 0, 255).astype("uint8")
+
+# Function to write a synthetic grayscale video with a moving shape
+def syntheticVideo(outputFile, imageWidth, imageHeight, frameCount, fps = 25):
+    base = syntheticImage(imageWidth, imageHeight)
+    outputVideo = cv.VideoWriter(outputFile, cv.VideoWriter_fourcc(*'mp4v'), fps, (imageWidth, imageHeight))
+    for i in range(frameCount):
+        videoFrame = np.roll(base, i * 4, axis = 1)
+        outputVideo.write(videoFrame)
+    outputVideo.release()
+    return outputFile
+
+# Function to return the peak resident memory of the process in MB, None when not available
+def peakMemoryMB():
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 2)
+
+# Function to summarize the latencies of repeated runs
+def summarize(latencies, itemsPerRun = 1):
+    latencies = np.asarray(latencies)
+    return {
+        "runs": len(latencies),
+        "throughput": round(itemsPerRun * len(latencies) / latencies.sum(), 4),
+        "mean": round(float(latencies.mean()), 6),
+        "p50": round(float(np.percentile(latencies, 50)), 6),
+        "p90": round(float(np.percentile(latencies, 90)), 6),
+        "p99": round(float(np.percentile(latencies, 99)), 6)
+    }
+
+# Function to time a function over warmup and measured runs
+def measure(function, repeat, warmup = 1):
+    for i in range(warmup):
+        function()
+    latencies = []
+    for i in range(repeat):
+        startTime = time.perf_counter()
+        function()
+        latencies.append(time.perf_counter() - startTime)
+    return latencies
+
+# Function to benchmark the stages of the image path at one resolution
+def benchmarkImages(engine, imageWidth, imageHeight, repeat, batchSize):
+    image = syntheticImage(imageWidth, imageHeight)
+    labImage, L = engine.preprocess(image)
+    AB_result = engine.predictAB(L)
+    images = [syntheticImage(imageWidth, imageHeight, seed) for seed in range(batchSize)]
+
+    return {
+        "preprocess": summarize(measure(lambda: engine.preprocess(image), repeat)),
+        "forward": summarize(measure(lambda: engine.predictAB(L), repeat)),
+        # reconstruct only writes over the A and B channel, so the LAB buffer can be reused
+        "reconstruct": summarize(measure(lambda: engine.reconstruct(labImage, AB_result), repeat)),
+        "colorize": summarize(measure(lambda: engine.colorize(image), repeat)),
+        "forwardBatch": summarize(measure(lambda: engine.predictABBatch([L] * batchSize), repeat), batchSize),
+        "colorizeBatch": summarize(measure(lambda: engine.colorizeBatch(images, batchSize), repeat), batchSize)
+    }
+
+# Function to benchmark the video pipeline on a synthetic clip
+def benchmarkVideo(engine, videoFile, repeat):
+    videoCapture = cv.VideoCapture(videoFile)
+    frameCount = int(videoCapture.get(cv.CAP_PROP_FRAME_COUNT))
+    videoCapture.release()
+
+    # Encoder sink discarding the frames, so only decoding and colorization are measured
+    class NullWriter:
+        def write(self, videoFrame):
+            pass
+
+    def decode():
+        videoCapture = cv.VideoCapture(videoFile)
+        while videoCapture.read()[0]:
+            pass
+        videoCapture.release()
+
+    def pipeline():
+        videoCapture = cv.VideoCapture(videoFile)
+        VideoPipeline(engine).run(videoCapture, NullWriter())
+        videoCapture.release()
+
+    return {
+        "frames": frameCount,
+        "decode": summarize(measure(decode, repeat, 0), frameCount),
+        "pipeline": summarize(measure(pipeline, repeat, 0), frameCount)
+    }
+
+# Function to describe the software and machine a benchmark ran on
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output = True, text = True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        "commit": commit,
+        "python": platform.python_version(),
+        "opencv": cv.__version__,
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "cpuCount": cpu_count(),
+        "openCVThreads": cv.getNumThreads()
+    }
+
+# Function to run the whole benchmark and return the report
+def runBenchmark(network = "standin", sizes = ((640, 480), (1920, 1080), (3840, 2160)), repeat = 10, batchSize = 8, videoSize = (640, 360), frameCount = 60, workFolder = None, inference = "opencv"):
+    workFolder = workFolder or tempfile.mkdtemp(prefix = "colorization_benchmark_")
+    engine = createEngine(network, batchSize, workFolder, inference)
+
+    report = {"network": network, "inference": engine.inference.describe(), "repeat": repeat, "batchSize": batchSize, "environment": environment(), "images": {}}
+    for imageWidth, imageHeight in sizes:
+        report["images"][f"{imageWidth}x{imageHeight}"] = benchmarkImages(engine, imageWidth, imageHeight, repeat, batchSize)
+
+    if frameCount > 0:
+        videoFile = syntheticVideo(path.join(workFolder, "synthetic.mp4"), videoSize[0], videoSize[1], frameCount)
+        report["video"] = {f"{videoSize[0]}x{videoSize[1]}": benchmarkVideo(engine, videoFile, max(1, repeat // 5))}
+
+    # Once for the whole run, the peak resident memory of the process is never reset between stages
+    report["peakMemoryMB"] = peakMemoryMB()
+    return report
+
+# Function to parse "640x480,1920x1080" into a list of (width, height)
+def parseSizes(text):
+    return [tuple(int(value) for value in size.lower().split("x")) for size in text.split(",") if size]
+
+# Function to write the report as JSON
+def writeReport(report, outputFile):
+    with open(outputFile, "w") as outputfile:
+        json.dump(report, outputfile, indent = 2)
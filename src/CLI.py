@@ -59,6 +59,9 @@ class Interface:
             invalidPath = []
 
             for dataPath in data:
+                # Only the file and folder paths are checked, other keys are tuning options
+                if not dataPath.endswith("Path"):
+                    continue
                 if not path.exists(data[dataPath]):
                     invalidPath.append(f"{dataPath}")
 
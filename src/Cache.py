@@ -0,0 +1,136 @@
+"""
+Content-addressed on-disk cache of the low resolution AB results
+Entries are keyed by a hash of the mean-centered L channel at network resolution and a
+fingerprint of the model files, and only store the small AB map of the network output.
+The cache is bounded in size and evicts the least recently used entries first. Writes are
+atomic renames, so several worker processes can share one cache folder.
+"""
+
+import hashlib
+import os
+import tempfile
+import threading
+from os import path
+import numpy as np
+
+# Function to hash the content of the model files, so results of another model are never reused
+def modelFingerprint(*filePaths):
+    digest = hashlib.sha256()
+    for filePath in filePaths:
+        if not filePath:
+            continue
+        with open(filePath, "rb") as file:
+            for chunk in iter(lambda: file.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+
+    def __init__(self, cacheFolder, maxBytes, fingerprint = ""):
+        self.cacheFolder = cacheFolder
+        self.maxBytes = maxBytes
+        self.fingerprint = fingerprint
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        os.makedirs(self.cacheFolder, exist_ok = True)
+        self.currentBytes = sum(size for entryFile, size, accessTime in self.listEntries())
+
+    # Function to compute the cache key of a network input
+    def key(self, L):
+        digest = hashlib.sha256(self.fingerprint.encode())
+        digest.update(str(L.shape).encode())
+        digest.update(np.ascontiguousarray(L, dtype = "float32").tobytes())
+        return digest.hexdigest()
+
+    # Function to map a key to its file, spread over 256 sub folders
+    def entryFile(self, key):
+        return path.join(self.cacheFolder, key[:2], key + ".npy")
+
+    # Function to return the stored AB result of a key, None on a miss
+    def get(self, key):
+        entryFile = self.entryFile(key)
+        try:
+            AB_result = np.load(entryFile)
+            # Mark the entry as recently used
+            os.utime(entryFile)
+        except (OSError, ValueError):
+            # Missing, evicted meanwhile by another worker, or partially written
+            with self.lock:
+                self.misses += 1
+            return None
+        with self.lock:
+            self.hits += 1
+        return AB_result
+
+    # Function to store the AB result of a key
+    def put(self, key, AB_result):
+        entryFile = self.entryFile(key)
+        if path.exists(entryFile):
+            # Same key, same AB result
+            return
+        os.makedirs(path.dirname(entryFile), exist_ok = True)
+        fileDescriptor, temporaryFile = tempfile.mkstemp(dir = path.dirname(entryFile), suffix = ".tmp")
+        try:
+            with os.fdopen(fileDescriptor, "wb") as file:
+                np.save(file, np.ascontiguousarray(AB_result, dtype = "float32"))
+            with self.lock:
+                # Another thread may have written the key meanwhile, only the size difference is added
+                oldSize = path.getsize(entryFile) if path.exists(entryFile) else 0
+                os.replace(temporaryFile, entryFile)
+                self.currentBytes += path.getsize(entryFile) - oldSize
+                evict = self.currentBytes > self.maxBytes
+        except OSError:
+            if path.exists(temporaryFile):
+                os.remove(temporaryFile)
+            return
+
+        if evict:
+            self.evict()
+
+    # Function to list (file, size, last access) of all entries
+    def listEntries(self):
+        entries = []
+        for folder in os.scandir(self.cacheFolder):
+            if not folder.is_dir():
+                continue
+            for entry in os.scandir(folder.path):
+                if not entry.name.endswith(".npy"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                entries.append((entry.path, stat.st_size, stat.st_mtime))
+        return entries
+
+    # Function to remove the least recently used entries until the cache is below 90% of its size
+    def evict(self):
+        with self.lock:
+            # Rescan, other workers may have added or removed entries
+            entries = sorted(self.listEntries(), key = lambda entry: entry[2])
+            currentBytes = sum(size for entryFile, size, accessTime in entries)
+            for entryFile, size, accessTime in entries:
+                if currentBytes <= self.maxBytes * 0.9:
+                    break
+                try:
+                    os.remove(entryFile)
+                    self.evictions += 1
+                except OSError:
+                    pass
+                currentBytes -= size
+            self.currentBytes = currentBytes
+
+    # Function to report the cache counters
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / requests, 4) if requests > 0 else 0.0,
+                "evictions": self.evictions,
+                "bytes": self.currentBytes,
+                "maxBytes": self.maxBytes
+            }
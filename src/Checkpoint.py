@@ -0,0 +1,69 @@
+"""
+Progress manifest of video jobs written in committed segments
+Every finished segment is renamed from its .part file and recorded in manifest.json with an
+atomic rename, so an interrupted job only redoes the segment it was working on. The manifest
+also records the input file and the job options; when they changed, the segments are discarded.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+from os import path
+
+class SegmentManifest:
+
+    def __init__(self, segmentFolder, job):
+        self.segmentFolder = segmentFolder
+        self.manifestFile = path.join(segmentFolder, "manifest.json")
+        # JSON round trip, so the job compares equal to the one read back from the manifest
+        self.job = json.loads(json.dumps(job))
+        self.completed = {}
+
+        if path.isfile(self.manifestFile):
+            try:
+                with open(self.manifestFile) as file:
+                    manifest = json.load(file)
+            except (OSError, ValueError):
+                manifest = {}
+            if manifest.get("job") == self.job:
+                self.completed = {int(index): frames for index, frames in manifest.get("completed", {}).items()
+                                  if path.isfile(self.segmentFile(int(index)))}
+            else:
+                # Segments of another input or other options
+                shutil.rmtree(segmentFolder, ignore_errors = True)
+        os.makedirs(segmentFolder, exist_ok = True)
+
+    # Function to return the file of a committed segment
+    def segmentFile(self, index):
+        return path.join(self.segmentFolder, f"segment_{index:05d}.mp4")
+
+    # Function to return the file a segment is written to before it is committed
+    def partFile(self, index):
+        return path.join(self.segmentFolder, f"segment_{index:05d}.part.mp4")
+
+    # Function to check whether a segment was committed by this or an earlier run
+    def isCompleted(self, index):
+        return index in self.completed
+
+    # Function to commit a written segment and record it in the manifest
+    def commit(self, index, frames):
+        os.replace(self.partFile(index), self.segmentFile(index))
+        self.completed[index] = frames
+        self.save()
+
+    # Function to write the manifest atomically
+    def save(self):
+        fileDescriptor, temporaryFile = tempfile.mkstemp(dir = self.segmentFolder, suffix = ".tmp")
+        try:
+            with os.fdopen(fileDescriptor, "w") as outputfile:
+                json.dump({"job": self.job, "completed": {str(index): frames for index, frames in sorted(self.completed.items())}}, outputfile)
+            os.replace(temporaryFile, self.manifestFile)
+        except OSError:
+            if path.exists(temporaryFile):
+                os.remove(temporaryFile)
+            raise
+
+    # Function to delete the segments and the manifest once the output is assembled
+    def remove(self):
+        shutil.rmtree(self.segmentFolder, ignore_errors = True)
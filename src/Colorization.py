@@ -21,32 +21,36 @@ Modified of Reference Source Code retrieved from:
 """
 
 import cv2 as cv
-import numpy as np
 from os import path
-import json
-import re
-from tqdm import tqdm
+from .Encoder import openVideoWriter
+from .Engine import getEngine
+from .LargeImage import ArrayWriter, colorizeStrips, memoryBudget, needsStrips, predictGlobalAB
+from .Pipeline import VideoPipeline
+from .Progressive import colorizeWithPreview
+from .Renditions import comparisonImage, writeRenditions
+from .Settings import loadSettings
+from .Sharding import shardVideo
+from .Temporal import TemporalColorizer
 
 class Colorization:
 
-    def __init__(self, inputPath, inputData = "image"):
+    def __init__(self, inputPath, inputData = "image", engine = None, outputPath = None, temporalMode = None, profile = None, segmentFrames = None, onPreview = None):
         self.inputPath = inputPath
-
-        # Set the file path to the pretrained model
-        with open("settings.json") as file:
-            data = json.load(file)
-            self.modelPath = data["modelPath"]
-            self.prototxtPath = data["prototxtPath"]
-            self.clusterPath = data["clusterPath"]
-
-        # Using OpenCV's Deep Neural Network Module to load the model
-        self.net = cv.dnn.readNetFromCaffe(self.prototxtPath, self.modelPath)
-        # Using numpy to load the pretrained cluster centers
-        pts_in_hull = np.load(self.clusterPath)
-        # Populate the ab cluster centers as 1x1 convolution kernel
-        pts_in_hull = pts_in_hull.transpose().reshape(2, 313, 1, 1)
-        self.net.getLayer(self.net.getLayerId("class8_ab")).blobs = [pts_in_hull.astype("float32")]
-        self.net.getLayer(self.net.getLayerId("conv8_313_rh")).blobs = [np.full([1, 313], 2.606, "float32")]
+        data = loadSettings()
+        # Folder where the colorized results are stored
+        self.outputPath = outputPath if outputPath is not None else data["outputPath"]
+        # Reuse the AB result of the previous frames of a video ("off", "reuse" or "warp")
+        self.temporalMode = temporalMode if temporalMode is not None else data.get("temporalMode", "off")
+        # Speed/quality profile of the network input ("preview", "standard", "high", ...), the engine default when None
+        self.profile = profile
+        # Frames per committed video segment, an interrupted video resumes from its last segment (0: single stream)
+        self.segmentFrames = segmentFrames if segmentFrames is not None else data.get("segmentFrames", 0)
+        # Called with a low resolution preview of an image before the full resolution reconstruction (progressive mode)
+        self.onPreview = onPreview
+
+        # Reuse the engine already loaded in this process instead of reloading the model
+        self.engine = engine if engine is not None else getEngine()
+        self.net = self.engine.net
 
         if inputData == "image":
             self.colorizedImage = self.getImageColor()
@@ -55,7 +59,20 @@ class Colorization:
 
     # Function to Colorize Image
     def getImageColor(self):
-        self.image = cv.imread(self.inputPath)
+        with self.engine.metrics.time("decode"):
+            self.image = cv.imread(self.inputPath)
+        self.imageHeight, self.imageWidth = self.image.shape[:2]
+        # Reconstruct images too large for the memory budget strip by strip
+        budget = memoryBudget()
+        if self.onPreview is not None:
+            # Preview first, the full resolution image from the same forward pass
+            colorizedImage, self.AB_result = colorizeWithPreview(self.engine, self.image, self.onPreview, profile = self.profile, budget = budget)
+            return colorizedImage
+        if needsStrips(self.imageHeight, self.imageWidth, budget):
+            self.AB_result = predictGlobalAB(self.engine, self.image, profile = self.profile)
+            writer = ArrayWriter(None, self.imageHeight, self.imageWidth)
+            colorizeStrips(self.engine, self.image, writer, budget, self.AB_result, profile = self.profile)
+            return writer.outputImage
         return self.processData()
     
     # Function to Colorize Video
@@ -66,99 +83,75 @@ class Colorization:
             print("Error capturing video data. Please Try Again.")
             return
 
-        videoCapturing, videoFrame = videoCapture.read()
-
-        with open("settings.json") as file:
-            data = json.load(file)
-        outputPath = data["outputPath"]
+        outputPath = self.outputPath
+        # Progress bar only needed by the video path
+        from tqdm import tqdm
+
+        if self.segmentFrames > 0:
+            frameCount = int(videoCapture.get(cv.CAP_PROP_FRAME_COUNT))
+            videoCapture.release()
+            print("Colorizing Video...")
+            with tqdm(total=frameCount) as progressBar:
+                self.segmentReport = shardVideo(self.inputPath, outputPath, jobs = 1, temporalMode = self.temporalMode, profile = self.profile,
+                                                segmentFrames = self.segmentFrames, engine = self.engine, progress = progressBar.update)
+            self.videoOutputPath = self.segmentReport["output"]
+            if self.segmentReport["segmentsResumed"] > 0:
+                print(f"Resumed after {self.segmentReport['segmentsResumed']} of {self.segmentReport['segments']} completed segments")
+            print(f"Colorization Completed! Video saved at: {self.videoOutputPath}")
+            return
 
-        outputVideo = cv.VideoWriter(path.join(outputPath, path.splitext(path.basename(self.inputPath))[0] + "_colorized.mp4"),
-                                     cv.VideoWriter_fourcc(*'mp4v'),
-                                     videoCapture.get(cv.CAP_PROP_FPS),
-                                     (int(videoCapture.get(cv.CAP_PROP_FRAME_WIDTH)), int(videoCapture.get(cv.CAP_PROP_FRAME_HEIGHT))),
-                                    #  isColor=True
-                                    )
+        # Encoded by ffmpeg (with the source audio) when installed, by OpenCV otherwise, see Encoder.py
+        outputVideo = openVideoWriter(path.join(outputPath, path.splitext(path.basename(self.inputPath))[0] + "_colorized.mp4"),
+                                      videoCapture.get(cv.CAP_PROP_FPS),
+                                      int(videoCapture.get(cv.CAP_PROP_FRAME_WIDTH)), int(videoCapture.get(cv.CAP_PROP_FRAME_HEIGHT)),
+                                      audioSource = self.inputPath,
+                                      duration = videoCapture.get(cv.CAP_PROP_FRAME_COUNT) / videoCapture.get(cv.CAP_PROP_FPS) if videoCapture.get(cv.CAP_PROP_FPS) > 0 else None)
 
         print("Colorizing Video...")
         # Print progression bar based on frames processed
-        with tqdm(total=int(videoCapture.get(cv.CAP_PROP_FRAME_COUNT))) as progressBar:
-            while videoCapturing:
-                self.image = videoFrame
-                colorizedImage = self.processData()
-                outputVideo.write(colorizedImage)
-                progressBar.update(1)
-                videoCapturing, videoFrame = videoCapture.read()
-
-        videoCapture.release()
-        outputVideo.release()
+        # while decoding, colorizing and encoding the frames on separate threads
+        colorizer = None
+        if self.temporalMode != "off":
+            colorizer = TemporalColorizer(self.engine, temporalMode = self.temporalMode, profile = self.profile)
+        try:
+            with tqdm(total=int(videoCapture.get(cv.CAP_PROP_FRAME_COUNT))) as progressBar:
+                VideoPipeline(self.engine, colorizer = colorizer, profile = self.profile).run(videoCapture, outputVideo, progressBar.update)
+        finally:
+            videoCapture.release()
+            outputVideo.release()
         self.videoOutputPath = path.join(outputPath, path.splitext(path.basename(self.inputPath))[0] + "_colorized.mp4")
         print(f"Colorization Completed! Video saved at: {self.videoOutputPath}")
+        if colorizer is not None:
+            self.temporalReport = colorizer.report()
+            print(f"Frames inferred: {self.temporalReport['framesInferred']}, Frames reused: {self.temporalReport['framesReused']}")
 
         return
 
     # Function to process image colorization by forwarding input images to CNN
     def processData(self):
         self.imageHeight, self.imageWidth = self.image.shape[:2]
-
-        # Normalize the RGB value of the image (between 0-1)
-        normalizedImage = self.image.astype("float32") / 255.0
-        # Convert Image to LAB color space
-        labImage = cv.cvtColor(normalizedImage, cv.COLOR_BGR2LAB)
-        # Down Scale Image to fit the CNN model (224 * 224)
-        resizedImage = cv.resize(labImage, (224, 224))
-        # Extract L channel and subtract 50 for mean-centering
-        L, A, B = cv.split(resizedImage) 
-        L -= 50
-
-        # Setup input for the CNN model
-        self.net.setInput(cv.dnn.blobFromImage(L))
-        # Forward the input into the CNN model and obtain the result of A and B channel
-        AB_result = self.net.forward()[0, :, :, :].transpose((1, 2, 0))
-
-        # Resize the Image back to its original size
-        AB_result = cv.resize(AB_result, (self.imageWidth, self.imageHeight))
-
-        # Obtain original L channel and combine with the AB result
-        L, A, B = cv.split(labImage)
-        colorizedImage = np.concatenate((L[:, :, np.newaxis], AB_result), axis = 2)
-
-        # Clip the values between 0-1 and Denormalize the values by multiplying 255
-        colorizedImage = np.clip(cv.cvtColor(colorizedImage, cv.COLOR_LAB2BGR), 0, 1)
-        colorizedImage = (colorizedImage * 255).astype("uint8")
-
-        return colorizedImage
+        labImage, L = self.engine.preprocess(self.image, profile = self.profile)
+        # Low resolution AB result, kept to reconstruct the comparison and the renditions at their own size
+        self.AB_result = self.engine.predictAB(L)
+        return self.engine.reconstruct(labImage, self.AB_result)
 
     # Function to compare images before and after colorization
     def compareImage(self):
-        colorizedImage = self.colorizedImage
-        originalImage = self.image
-
-        if (1920 / (self.imageWidth * 2)) < (1080 / (self.imageHeight * 2)):
-            comparisonImage = np.vstack((originalImage, colorizedImage))
+        # Both sides scaled up or down to the display size, the colorized one reconstructed from the AB result
+        resizedImage, layout = comparisonImage(self.engine, self.image, self.AB_result, 1920, 1080, enlarge = True)
+        if layout == "vertical":
             comparisonText = "Colorization Before (Top) and After (Bottom)"
         else:
-            comparisonImage = np.hstack((originalImage, colorizedImage))
             comparisonText = "Colorization Before (Left) and After (Right)"
-        
-        height, width = comparisonImage.shape[:2]
-        scalar = min(1920 / width, 1080 / height)
-        resizedImage = cv.resize(comparisonImage, (int(width * scalar), int(height * scalar)))
-        
+
         cv.imshow(comparisonText, resizedImage)
         cv.waitKey(0)
 
-    # Function to store images in the output file
+    # Function to store the renditions of the output spec (renditions in settings.json) in the output folder
     def outputImage(self):
-        with open("settings.json") as file:
-            data = json.load(file)
-        outputPath = data["outputPath"]
-        fileName = path.basename(self.inputPath)
-        if re.search(".jpg", fileName):
-            outputFileName = fileName.replace(".jpg", "_colorized.jpg")
-        if re.search(".png", fileName):
-            outputFileName = fileName.replace(".png", "_colorized.png")
-        cv.imwrite(path.join(outputPath, outputFileName), self.colorizedImage)
-        print(f"Image saved at: {outputPath}/{outputFileName}")
+        outputFiles = writeRenditions(self.engine, self.image, self.AB_result, self.inputPath, self.outputPath, colorizedImage = self.colorizedImage)
+        for outputFile in outputFiles:
+            print(f"Image saved at: {outputFile}")
 
     # Function to view video after colorization
     def viewVideo(self):
@@ -0,0 +1,123 @@
+"""
+Video writer stage encoding through an external ffmpeg process
+The colorized frames are piped as raw BGR24 into ffmpeg, which encodes them with the configured
+codec, preset, CRF and thread count in its own process, concurrently with the inference stages,
+and copies the audio track of the source into the output. Without ffmpeg or the codec the frames
+are written with OpenCV's mp4v VideoWriter instead.
+"""
+
+import shutil
+import subprocess
+import tempfile
+import cv2 as cv
+import numpy as np
+from .Settings import loadSettings
+
+# Encoder options overriding settings.json (command line), see setEncoderOptions
+encoderOptions = {}
+
+# Encoders of every ffmpeg executable asked so far
+_encoders = {}
+
+# Function to find the ffmpeg executable, None when it is not installed
+def findFFmpeg():
+    try:
+        ffmpegPath = loadSettings().get("ffmpegBinary", "ffmpeg")
+    except FileNotFoundError:
+        ffmpegPath = "ffmpeg"
+    return shutil.which(ffmpegPath)
+
+# Function to return the names of the encoders an ffmpeg executable was built with
+def ffmpegEncoders(ffmpegPath):
+    if ffmpegPath not in _encoders:
+        result = subprocess.run([ffmpegPath, "-hide_banner", "-encoders"], capture_output = True, text = True)
+        lines = result.stdout.splitlines()
+        # The encoders are listed after the legend, one " V..... name description" per line
+        start = next((i + 1 for i, line in enumerate(lines) if line.strip().startswith("---")), len(lines))
+        _encoders[ffmpegPath] = {line.split()[1] for line in lines[start:] if len(line.split()) > 1}
+    return _encoders[ffmpegPath]
+
+# Function to set the encoder options of this process (encoder, codec, preset, crf, threads, audio)
+def setEncoderOptions(options):
+    encoderOptions.update({key: value for key, value in (options or {}).items() if value is not None})
+
+# Function to return the encoder options in effect, the command line before settings.json
+def encoderSettings():
+    try:
+        data = loadSettings()
+    except FileNotFoundError:
+        data = {}
+    return {
+        # "auto" uses ffmpeg when it is installed with the codec, "ffmpeg" requires it, "opencv" never uses it
+        "encoder": encoderOptions.get("encoder", data.get("videoEncoder", "auto")),
+        "codec": encoderOptions.get("codec", data.get("videoCodec", "libx264")),
+        "preset": encoderOptions.get("preset", data.get("videoPreset", "veryfast")),
+        "crf": encoderOptions.get("crf", data.get("videoCRF", 23)),
+        # 0 lets ffmpeg choose
+        "threads": encoderOptions.get("threads", data.get("videoEncoderThreads", 0)),
+        "audio": encoderOptions.get("audio", data.get("videoAudio", True))
+    }
+
+# Function to open the writer of a colorized video, audioSource is the video whose audio track is copied
+# duration (seconds of video) trims the copied audio, the video stream sets the length of the output
+def openVideoWriter(outputFile, fps, frameWidth, frameHeight, audioSource = None, duration = None):
+    options = encoderSettings()
+    if options["encoder"] != "opencv":
+        ffmpegPath = findFFmpeg()
+        if ffmpegPath is not None and options["codec"] in ffmpegEncoders(ffmpegPath):
+            return FFmpegWriter(outputFile, fps, frameWidth, frameHeight, ffmpegPath, options, audioSource if options["audio"] else None, duration)
+        if options["encoder"] == "ffmpeg":
+            raise ValueError(f"ffmpeg with the {options['codec']} encoder is not installed")
+    return cv.VideoWriter(outputFile, cv.VideoWriter_fourcc(*'mp4v'), fps, (frameWidth, frameHeight))
+
+# Writer with the interface of cv.VideoWriter feeding an ffmpeg process
+class FFmpegWriter:
+
+    def __init__(self, outputFile, fps, frameWidth, frameHeight, ffmpegPath, options, audioSource = None, duration = None):
+        self.outputFile = outputFile
+        command = [ffmpegPath, "-y", "-loglevel", "error",
+                   "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{frameWidth}x{frameHeight}", "-r", str(fps or 25), "-i", "-"]
+        if audioSource:
+            # The audio track is optional, a silent source gives a silent output
+            # Only the audio is trimmed, a shorter audio track never cuts frames of the video
+            if duration:
+                command += ["-t", f"{duration:.6f}"]
+            command += ["-i", audioSource, "-map", "0:v:0", "-map", "1:a:0?", "-c:a", "copy"]
+        command += ["-c:v", options["codec"], "-threads", str(options["threads"])]
+        if options["preset"]:
+            command += ["-preset", str(options["preset"])]
+        if options["crf"] is not None:
+            command += ["-crf", str(options["crf"])]
+        if frameWidth % 2 or frameHeight % 2:
+            # yuv420p needs even sides
+            command += ["-vf", f"pad={frameWidth + frameWidth % 2}:{frameHeight + frameHeight % 2}"]
+        command += ["-pix_fmt", "yuv420p", outputFile]
+        # A file instead of a pipe, so a chatty ffmpeg can never block on its error output
+        self.errorFile = tempfile.TemporaryFile()
+        self.process = subprocess.Popen(command, stdin = subprocess.PIPE, stderr = self.errorFile)
+
+    def isOpened(self):
+        return self.process.poll() is None
+
+    def write(self, videoFrame):
+        try:
+            self.process.stdin.write(np.ascontiguousarray(videoFrame).data)
+        except BrokenPipeError:
+            # ffmpeg stopped, release reports its error
+            self.release()
+            raise
+
+    # Function to finish the encoding, raises when ffmpeg failed
+    def release(self):
+        if self.process.stdin.closed:
+            return
+        try:
+            self.process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returnCode = self.process.wait()
+        self.errorFile.seek(0)
+        message = self.errorFile.read().decode(errors = "replace").strip()
+        self.errorFile.close()
+        if returnCode != 0:
+            raise ValueError(f"ffmpeg failed to encode {self.outputFile}: {message}")
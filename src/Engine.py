@@ -0,0 +1,234 @@
+"""
+Long-lived colorization engine holding the pretrained CAFFE network of Zhang, R.
+The network and the cluster centers are loaded once per process and shared by
+the image, video and CLI paths instead of being reloaded for every input.
+"""
+
+import threading
+import cv2 as cv
+import numpy as np
+from .Backends import loadBackend
+from .Cache import ResultCache, modelFingerprint
+from .Metrics import Metrics, NullMetrics
+from .Settings import loadSettings
+
+# Network input size (longer side) of the speed/quality profiles
+# "<profile>-aspect" keeps the aspect ratio of the image instead of a square input
+profiles = {
+    "preview": 128,
+    "standard": 224,
+    "high": 320,
+    "archival": 384
+}
+profileNames = list(profiles) + [f"{profile}-aspect" for profile in profiles]
+
+# Backend, target and thread count overriding settings.json (command line), see setDNNOptions
+dnnOptions = {}
+
+class ColorizationEngine:
+
+    def __init__(self, modelPath = None, prototxtPath = None, clusterPath = None, batchSize = None, cacheFolder = None, artifactFile = None, inferenceBackend = None):
+        # Fall back to settings.json for anything not given
+        data = {}
+        if None in (modelPath, prototxtPath, clusterPath, batchSize, cacheFolder, artifactFile, inferenceBackend):
+            data = loadSettings()
+        # Pre-baked model artifact (see Artifact.py), used instead of the model files when set
+        self.artifactFile = artifactFile if artifactFile is not None else data.get("artifactFile", "")
+        self.modelPath = modelPath or data.get("modelPath")
+        self.prototxtPath = prototxtPath or data.get("prototxtPath")
+        self.clusterPath = clusterPath or data.get("clusterPath")
+        # Number of images stacked into a single forward pass
+        self.batchSize = batchSize or data.get("batchSize", 8)
+        # Speed/quality profile used when a call does not select one
+        self.setProfile(data.get("profile", "standard"))
+
+        # Backend running the network ("opencv" or "numpy", see Backends.py)
+        self.inference = loadBackend(inferenceBackend or data.get("inferenceBackend", "opencv"),
+                                     self.modelPath, self.prototxtPath, self.clusterPath, self.artifactFile)
+        # cv.dnn.Net of the OpenCV backend, None for other backends
+        self.net = getattr(self.inference, "net", None)
+
+        # cv.dnn.Net is not reentrant, only the forward pass is serialized
+        self.lock = threading.Lock()
+        # Run the network on the configured backend, target and number of threads
+        self.configure(dnnOptions.get("backend", data.get("dnnBackend", "default")),
+                       dnnOptions.get("target", data.get("dnnTarget", "cpu")),
+                       dnnOptions.get("threads", data.get("dnnThreads", 0)))
+
+        # Optional on-disk cache of the AB results, disabled when no folder is set
+        self.cache = None
+        cacheFolder = cacheFolder if cacheFolder is not None else data.get("cacheFolder", "")
+        if cacheFolder:
+            fingerprint = self.inference.fingerprint or modelFingerprint(self.modelPath, self.prototxtPath, self.clusterPath)
+            self.cache = ResultCache(cacheFolder, int(data.get("cacheSizeMB", 256) * 1024 * 1024), fingerprint)
+
+        # Pre and post processing buffers of every thread using the engine
+        self.buffers = FrameBuffers()
+        # Per-stage timings, a no-op unless enabled in settings.json or with enableMetrics
+        self.metrics = Metrics() if data.get("metrics", False) else NullMetrics()
+
+    # Function to start collecting per-stage timings, returns the Metrics
+    def enableMetrics(self):
+        if not self.metrics.enabled:
+            self.metrics = Metrics()
+        return self.metrics
+
+    # Function to select the DNN backend, target and OpenCV thread count (0: OpenCV default)
+    # The thread count is shared by the whole process, keep threads x processes <= cores
+    def configure(self, backend = None, target = None, threads = None):
+        with self.lock:
+            self.inference.configure(backend, target, threads)
+
+    # Function to change the default speed/quality profile
+    def setProfile(self, profile):
+        self.networkSize(224, 224, profile)
+        self.profile = profile
+
+    # Function to return the (width, height) of the network input for an image and a profile
+    def networkSize(self, imageHeight, imageWidth, profile = None):
+        profile = profile or self.profile
+        name, separator, mode = profile.partition("-")
+        if name not in profiles or mode not in ("", "aspect"):
+            raise ValueError(f"Unknown profile: {profile} (available: {', '.join(profileNames)})")
+        size = profiles[name]
+        if mode == "":
+            return size, size
+        # Longer side at the profile size, both sides a multiple of 8 like the network strides
+        scale = size / max(imageHeight, imageWidth)
+        return max(8, round(imageWidth * scale / 8) * 8), max(8, round(imageHeight * scale / 8) * 8)
+
+    # Function to colorize a single BGR image
+    def colorize(self, image, profile = None):
+        labImage, L = self.preprocess(image, profile = profile)
+        AB_result = self.predictAB(L)
+        return self.reconstruct(labImage, AB_result)
+
+    # Function to colorize a list of BGR images with one forward pass per batch
+    def colorizeBatch(self, images, batchSize = None, profile = None):
+        batchSize = batchSize or self.batchSize
+        colorizedImages = []
+        for start in range(0, len(images), batchSize):
+            preprocessed = [self.preprocess(image, slot, profile) for slot, image in enumerate(images[start:start + batchSize])]
+            AB_results = self.predictABBatch([L for labImage, L in preprocessed])
+            for (labImage, L), AB_result in zip(preprocessed, AB_results):
+                colorizedImages.append(self.reconstruct(labImage, AB_result))
+        return colorizedImages
+
+    # Function to convert an image to LAB and extract the network input
+    # slot selects the reused LAB buffer, images preprocessed together need different slots
+    def preprocess(self, image, slot = 0, profile = None):
+        imageHeight, imageWidth = image.shape[:2]
+        labImage = self.buffers.get(f"lab{slot}", (imageHeight, imageWidth, 3))
+        with self.metrics.time("normalize"):
+            # Normalize the RGB value of the image (between 0-1)
+            np.divide(image, np.float32(255.0), out = labImage)
+            # Convert Image to LAB color space, in place
+            cv.cvtColor(labImage, cv.COLOR_BGR2LAB, dst = labImage)
+        with self.metrics.time("resize"):
+            # Down Scale Image to the network input size of the profile (224 * 224 by default)
+            resizedImage = cv.resize(labImage, self.networkSize(imageHeight, imageWidth, profile))
+        # Extract L channel and subtract 50 for mean-centering
+        L = resizedImage[:, :, 0] - 50
+        return labImage, L
+
+    # Function to forward the mean-centered L channel and obtain the low resolution AB channels
+    def predictAB(self, L):
+        return self.predictABBatch([L])[0]
+
+    # Function to forward N mean-centered L channels, as one Nx1xHxW blob per input size
+    def predictABBatch(self, Ls):
+        AB_results = [None] * len(Ls)
+        if self.cache is not None:
+            keys = [self.cache.key(L) for L in Ls]
+            AB_results = [self.cache.get(key) for key in keys]
+        missing = [i for i, AB_result in enumerate(AB_results) if AB_result is None]
+        if self.cache is not None:
+            self.metrics.increment("cache_hits", len(Ls) - len(missing))
+            self.metrics.increment("cache_misses", len(missing))
+        if len(missing) == 0:
+            return AB_results
+
+        # Inputs of different sizes (aspect preserving profiles) are forwarded separately
+        groups = {}
+        for i in missing:
+            groups.setdefault(Ls[i].shape, []).append(i)
+        for group in groups.values():
+            with self.lock, self.metrics.time("forward", len(group)):
+                # Forward the input into the CNN model and obtain the result of A and B channel
+                forwardResults = self.inference.forward(cv.dnn.blobFromImages([Ls[i] for i in group]))
+
+            # Split the Nx2x(H/4)x(W/4) result back into one map per input (56x56x2 for 224)
+            for i, AB_result in zip(group, forwardResults):
+                AB_results[i] = AB_result.transpose((1, 2, 0))
+                if self.cache is not None:
+                    self.cache.put(keys[i], AB_results[i])
+        return AB_results
+
+    # Function to combine the original L channel with the predicted AB channels
+    # labImage is overwritten, the result is written into outputImage when given
+    # slot selects the reused work buffers, images of different sizes keep theirs in different slots
+    def reconstruct(self, labImage, AB_result, outputImage = None, slot = 0):
+        imageHeight, imageWidth = labImage.shape[:2]
+
+        # Resize the AB result back to the original size
+        with self.metrics.time("upsample"):
+            upscaledAB = self.buffers.get(f"ab{slot}", (imageHeight, imageWidth, 2))
+            cv.resize(AB_result, (imageWidth, imageHeight), dst = upscaledAB)
+
+        with self.metrics.time("lab2bgr"):
+            # Keep the original L channel and replace the A and B channel with the result
+            labImage[:, :, 1:] = upscaledAB
+            colorizedImage = self.buffers.get(f"bgr{slot}", (imageHeight, imageWidth, 3))
+            cv.cvtColor(labImage, cv.COLOR_LAB2BGR, dst = colorizedImage)
+
+            # Clip the values between 0-1 and Denormalize the values by multiplying 255
+            np.clip(colorizedImage, 0, 1, out = colorizedImage)
+            np.multiply(colorizedImage, 255, out = colorizedImage)
+            if outputImage is None:
+                outputImage = np.empty((imageHeight, imageWidth, 3), "uint8")
+            np.copyto(outputImage, colorizedImage, casting = "unsafe")
+
+        return outputImage
+
+# Per-thread float32 work buffers, reused as long as the frame size does not change
+class FrameBuffers(threading.local):
+
+    def __init__(self):
+        self.buffers = {}
+
+    # Function to return the named buffer, reallocated only when the shape changes
+    def get(self, name, shape, dtype = "float32"):
+        buffer = self.buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = np.empty(shape, dtype)
+            self.buffers[name] = buffer
+        return buffer
+
+# Engines already loaded in this process, keyed by their model files
+_engines = {}
+_enginesLock = threading.Lock()
+
+# Function to obtain the shared engine for the model files in settings.json
+def getEngine(modelPath = None, prototxtPath = None, clusterPath = None, artifactFile = None):
+    if None in (modelPath, prototxtPath, clusterPath, artifactFile):
+        data = loadSettings()
+        modelPath = modelPath or data["modelPath"]
+        prototxtPath = prototxtPath or data["prototxtPath"]
+        clusterPath = clusterPath or data["clusterPath"]
+        artifactFile = artifactFile if artifactFile is not None else data.get("artifactFile", "")
+
+    # Reload only when the model files were changed in the Settings menu
+    key = (modelPath, prototxtPath, clusterPath, artifactFile)
+    with _enginesLock:
+        if key not in _engines:
+            _engines.clear()
+            _engines[key] = ColorizationEngine(modelPath, prototxtPath, clusterPath, artifactFile = artifactFile)
+        return _engines[key]
+
+# Function to override the DNN settings of this process, also used as Pool initializer
+# options: {"backend": name, "target": name, "threads": count}, None values are ignored
+def setDNNOptions(options):
+    dnnOptions.update({key: value for key, value in options.items() if value is not None})
+    with _enginesLock:
+        for engine in _engines.values():
+            engine.configure(**dnnOptions)
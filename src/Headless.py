@@ -0,0 +1,496 @@
+"""
+Non-interactive command line for batch jobs (cron, containers)
+Usage: python main.py images|video <paths/globs/folders> --out DIR --jobs N --recursive
+       python main.py sync ./input --out ./output --jobs 4 --prune
+       python main.py live 0 --latency 200
+       python main.py serve --host 127.0.0.1 --port 8080
+       ffmpeg -i in.mkv -f rawvideo -pix_fmt bgr24 - | python main.py pipe --width W --height H | ffmpeg ...
+       python main.py benchmark --network standin --summary bench.json
+       python main.py bake --out model/colorization.artifact
+       python main.py tune --jobs 4
+A JSON summary is printed to stdout and the exit code is non-zero when any input failed.
+"""
+
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+from contextlib import redirect_stdout
+from multiprocessing import Pool
+from os import path, makedirs, cpu_count
+import cv2 as cv
+from .Artifact import bakeArtifact
+from .Colorization import Colorization
+from .Encoder import setEncoderOptions
+from .Backends import backends, inferenceBackends, targets
+from .Engine import getEngine, profileNames, setDNNOptions
+from .LargeImage import colorizeLargeImage, memoryBudget
+from .Metrics import Metrics
+from .Renditions import colorizeRenditions, defaultSpec, loadSpec
+from .Settings import loadSettings
+from .Sharding import shardVideo
+from .Temporal import temporalModes
+
+# File extensions accepted by the image and video colorization menus
+extensions = {
+    "images": ["jpg", "jpeg", "png", "webp", "ppm", "pnm"],
+    "video": ["mp4"]
+}
+
+# Function to expand the given paths, globs and folders into (input file, output sub folder) pairs
+def collectInputs(patterns, mode, recursive = False):
+    inputs = []
+    seen = set()
+    for pattern in patterns:
+        if path.isdir(pattern):
+            matches = []
+            for e in extensions[mode]:
+                matches.extend(glob.glob(path.join(pattern, "**" if recursive else "", "*." + e), recursive = recursive))
+            # Keep the folder structure below the given folder in the output folder
+            pairs = [(match, path.relpath(path.dirname(match), pattern)) for match in sorted(matches)]
+        else:
+            pairs = [(match, "") for match in sorted(glob.glob(pattern, recursive = recursive))]
+
+        for inputFile, subFolder in pairs:
+            if path.isfile(inputFile) and path.abspath(inputFile) not in seen:
+                seen.add(path.abspath(inputFile))
+                inputs.append((inputFile, "" if subFolder == "." else subFolder))
+    return inputs
+
+# Function to load the network once in every worker process
+def initWorker(dnnOptions):
+    setDNNOptions(dnnOptions)
+    try:
+        getEngine()
+    except Exception:
+        # The error is reported per input by runTask
+        pass
+
+# Function to colorize a single image file
+# Every rendition of the output spec is written from a single forward pass, returns the written files
+def colorizeImage(inputFile, outputFolder, options):
+    name, extension = path.splitext(path.basename(inputFile))
+    budget = options.get("memory") or memoryBudget()
+    engine = getEngine()
+    # Memory mapped input and streamed output, only the full size image
+    if extension.lower() in (".ppm", ".pnm"):
+        return [colorizeLargeImage(engine, inputFile, path.join(outputFolder, name + "_colorized" + extension), budget, options.get("profile"))]
+
+    with engine.metrics.time("decode"):
+        image = cv.imread(inputFile)
+    if image is None:
+        raise ValueError(f"Unable to read image: {inputFile}")
+    return colorizeRenditions(engine, image, inputFile, outputFolder, options.get("renditions"), options.get("profile"), budget)
+
+# Function to colorize a single video file
+def colorizeVideo(inputFile, outputFolder, options):
+    setEncoderOptions(options.get("encoder"))
+    segmentFrames = options.get("segmentFrames")
+    if segmentFrames is None:
+        segmentFrames = loadSettings().get("segmentFrames", 0)
+    if options.get("shards", 1) > 1 or segmentFrames > 0:
+        # The temporal mode of settings.json when the command line sets none, as in Colorization
+        temporalMode = options.get("temporal")
+        if temporalMode is None:
+            temporalMode = loadSettings().get("temporalMode", "off")
+        # Committed segments, so an interrupted job resumes where it stopped
+        report = shardVideo(inputFile, outputFolder, options["shards"], options["jobs"] if options.get("shards", 1) > 1 else 1,
+                            temporalMode, options.get("dnn"), options.get("profile"), segmentFrames)
+        return report.pop("output"), report
+    # Keep stdout free for the JSON summary
+    with redirect_stdout(sys.stderr):
+        instance = Colorization(inputFile, inputData = "video", engine = getEngine(), outputPath = outputFolder, temporalMode = options.get("temporal"), profile = options.get("profile"),
+                                 segmentFrames = segmentFrames)
+    if not hasattr(instance, "videoOutputPath"):
+        raise ValueError(f"Unable to read video: {inputFile}")
+    return instance.videoOutputPath, getattr(instance, "temporalReport", None)
+
+# Function to run one job inside a worker and report its result instead of raising
+def runTask(task):
+    mode, inputFile, outputFolder, options = task
+    startTime = time.perf_counter()
+    result = {"input": inputFile, "output": None, "status": "ok", "error": None}
+    try:
+        makedirs(outputFolder, exist_ok = True)
+        if options.get("metrics"):
+            getEngine().enableMetrics().reset()
+        if mode == "images":
+            outputFiles = colorizeImage(inputFile, outputFolder, options)
+            result["output"] = outputFiles[0]
+            if len(outputFiles) > 1:
+                result["renditions"] = outputFiles
+        else:
+            result["output"], videoReport = colorizeVideo(inputFile, outputFolder, options)
+            if videoReport is not None:
+                result["frames"] = videoReport
+    except Exception as instance:
+        result["status"] = "failed"
+        result["error"] = str(instance)
+    if options.get("metrics") and result["status"] == "ok":
+        result["metrics"] = getEngine().metrics.summary()
+    result["seconds"] = round(time.perf_counter() - startTime, 4)
+    return result
+
+# Function to add the DNN backend, target and thread options to a sub command
+def addDNNArguments(subparser):
+    subparser.add_argument("--backend", choices = list(backends), help = "DNN backend (default: dnnBackend in settings.json)")
+    subparser.add_argument("--target", choices = list(targets), help = "DNN target device (default: dnnTarget in settings.json)")
+    subparser.add_argument("--threads", type = int, help = "OpenCV threads per process, 0 for the OpenCV default (default: dnnThreads in settings.json, or the cores divided by --jobs)")
+
+# Function to return the DNN options of the parsed arguments
+# Without an explicit thread count, parallel workers share the cores instead of oversubscribing them
+def dnnOptionsOf(args, jobs = 1):
+    threads = args.threads
+    if threads is None and jobs > 1 and not loadSettings().get("dnnThreads", 0):
+        threads = max(1, (cpu_count() or 1) // jobs)
+    return {"backend": args.backend, "target": args.target, "threads": threads}
+
+# Function to return the encoder options of the parsed arguments of the video command
+def encoderOptionsOf(args):
+    if args.mode != "video":
+        return None
+    return {
+        "encoder": args.encoder,
+        "codec": args.codec,
+        "preset": args.preset,
+        "crf": args.crf,
+        "threads": args.encoder_threads,
+        "audio": False if args.no_audio else None
+    }
+
+# Function to build the argument parser of the headless command
+def buildParser():
+    parser = argparse.ArgumentParser(prog = "main.py", description = "Colorize images or videos without the interactive menu.")
+    subparsers = parser.add_subparsers(dest = "mode", required = True)
+    for mode in extensions:
+        subparser = subparsers.add_parser(mode, help = f"Colorize {mode} (." + " .".join(extensions[mode]) + ")")
+        subparser.add_argument("inputs", nargs = "+", help = "Input files, glob patterns or folders")
+        subparser.add_argument("--out", help = "Output folder (default: outputPath in settings.json)")
+        subparser.add_argument("--jobs", type = int, default = 1, help = "Number of worker processes, each holding its own network")
+        subparser.add_argument("--recursive", action = "store_true", help = "Search folders and ** patterns recursively")
+        subparser.add_argument("--summary", help = "Also write the JSON summary to this file")
+        subparser.add_argument("--profile", choices = profileNames, help = "Speed/quality profile, network input of 128 (preview), 224 (standard), 320 (high) or 384 (archival), -aspect keeps the image aspect ratio (default: profile in settings.json)")
+        subparser.add_argument("--metrics", help = "Collect per-stage timings and write them to this file (Prometheus text for .prom, JSON otherwise)")
+        if mode == "images":
+            subparser.add_argument("--renditions", help = "JSON file with the output spec, the files written for every image (default: renditions in settings.json)")
+            subparser.add_argument("--memory", type = int, help = "Memory budget in MB, larger images are reconstructed in strips (default: memoryBudgetMB in settings.json)")
+        if mode == "video":
+            subparser.add_argument("--temporal", choices = temporalModes, help = "Only infer keyframes and reuse or warp their AB result in between")
+            subparser.add_argument("--shards", type = int, default = 1, help = "Split every video into this many frame ranges colorized by --jobs processes")
+            subparser.add_argument("--segment-frames", type = int, help = "Write videos in committed segments of this many frames, a rerun of an interrupted job resumes from the last segment (default: segmentFrames in settings.json, 0 to disable)")
+            subparser.add_argument("--encoder", choices = ["auto", "ffmpeg", "opencv"], help = "Encode with ffmpeg (auto: when installed with the codec) or OpenCV's mp4v writer (default: videoEncoder in settings.json)")
+            subparser.add_argument("--codec", help = "ffmpeg video encoder, e.g. libx264, libx265, libvpx-vp9 (default: videoCodec in settings.json)")
+            subparser.add_argument("--preset", help = "ffmpeg encoder preset, e.g. ultrafast, veryfast, medium (default: videoPreset in settings.json)")
+            subparser.add_argument("--crf", type = int, help = "ffmpeg constant rate factor, lower is better quality and larger (default: videoCRF in settings.json)")
+            subparser.add_argument("--encoder-threads", type = int, help = "ffmpeg encoder threads, 0 lets ffmpeg choose (default: videoEncoderThreads in settings.json)")
+            subparser.add_argument("--no-audio", action = "store_true", help = "Do not copy the audio track of the source into the output")
+        addDNNArguments(subparser)
+
+    subparser = subparsers.add_parser("sync", help = "Only colorize the new or changed images of a folder, tracked in a manifest in the output folder")
+    subparser.add_argument("input", help = "Input folder, searched recursively")
+    subparser.add_argument("--out", help = "Output folder (default: outputPath in settings.json)")
+    subparser.add_argument("--jobs", type = int, default = 1, help = "Number of worker processes, each holding its own network")
+    subparser.add_argument("--hash", action = "store_true", help = "Also store content hashes, so touched but unmodified images are not colorized again")
+    subparser.add_argument("--prune", action = "store_true", help = "Delete the outputs of images that vanished from the input folder")
+    subparser.add_argument("--renditions", help = "JSON file with the output spec, the files written for every image (default: renditions in settings.json)")
+    subparser.add_argument("--profile", choices = profileNames, help = "Speed/quality profile (default: profile in settings.json)")
+    subparser.add_argument("--summary", help = "Also write the JSON summary to this file")
+    addDNNArguments(subparser)
+
+    subparser = subparsers.add_parser("pipe", help = "Colorize raw BGR24 frames from stdin to stdout")
+    subparser.add_argument("--width", type = int, required = True, help = "Frame width in pixels")
+    subparser.add_argument("--height", type = int, required = True, help = "Frame height in pixels")
+    subparser.add_argument("--batch", type = int, help = "Frames per forward pass (default: batchSize in settings.json)")
+    subparser.add_argument("--temporal", choices = temporalModes, default = "off", help = "Only infer keyframes and reuse or warp their AB result in between")
+    subparser.add_argument("--profile", choices = profileNames, help = "Speed/quality profile (default: profile in settings.json)")
+    addDNNArguments(subparser)
+
+    subparser = subparsers.add_parser("live", help = "Colorize a camera or stream with bounded latency, dropping stale frames")
+    subparser.add_argument("source", nargs = "?", default = "0", help = "Camera index, stream URL or video file (default: camera 0)")
+    subparser.add_argument("--synthetic", help = "Use a synthetic camera of this resolution (e.g. 640x480) instead of the source")
+    subparser.add_argument("--fps", type = float, default = 25, help = "Frame rate of the synthetic camera")
+    subparser.add_argument("--latency", type = float, help = "End-to-end latency target in milliseconds (default: liveLatencyMs in settings.json)")
+    subparser.add_argument("--fixed-size", action = "store_true", help = "Keep the network input size of the profile instead of lowering it to meet the latency target")
+    subparser.add_argument("--profile", choices = profileNames, help = "Speed/quality profile, the largest input of the adaptive sizing (default: profile in settings.json)")
+    subparser.add_argument("--duration", type = float, help = "Stop after this many seconds")
+    subparser.add_argument("--frames", type = int, help = "Stop after this many colorized frames")
+    subparser.add_argument("--show", action = "store_true", help = "Display the colorized frames in a window, q or Esc to stop")
+    subparser.add_argument("--summary", help = "Also write the JSON stats to this file")
+    addDNNArguments(subparser)
+
+    subparser = subparsers.add_parser("serve", help = "Run the local HTTP colorization service")
+    subparser.add_argument("--host", default = "127.0.0.1", help = "Address to listen on")
+    subparser.add_argument("--port", type = int, default = 8080, help = "Port to listen on")
+    subparser.add_argument("--max-batch", type = int, help = "Largest number of requests forwarded together (default: batchSize in settings.json)")
+    subparser.add_argument("--batch-window", type = float, help = "Milliseconds to wait for more requests to batch (default: batchWindowMs in settings.json)")
+    subparser.add_argument("--queue-size", type = int, help = "Requests waiting for the network before answering 503 (default: requestQueueSize in settings.json)")
+    subparser.add_argument("--max-concurrent", type = int, help = "Concurrent requests before answering 503 (default: maxConcurrentRequests in settings.json)")
+    subparser.add_argument("--profile", choices = profileNames, help = "Default speed/quality profile of the requests (default: profile in settings.json)")
+    addDNNArguments(subparser)
+
+    subparser = subparsers.add_parser("benchmark", help = "Measure the throughput of every stage on synthetic inputs")
+    subparser.add_argument("--network", choices = ["standin", "caffe"], default = "standin", help = "Generated stand-in network or the Caffe model in settings.json")
+    subparser.add_argument("--sizes", default = "640x480,1920x1080,3840x2160", help = "Comma separated image resolutions")
+    subparser.add_argument("--repeat", type = int, default = 10, help = "Measured runs per stage")
+    subparser.add_argument("--batch", type = int, default = 8, help = "Batch size of the batched stages")
+    subparser.add_argument("--video-size", default = "640x360", help = "Resolution of the synthetic video")
+    subparser.add_argument("--frames", type = int, default = 60, help = "Frames of the synthetic video, 0 to skip the video benchmark")
+    subparser.add_argument("--inference", choices = list(inferenceBackends), default = "opencv", help = "Inference backend running the network")
+    subparser.add_argument("--summary", help = "Also write the JSON report to this file")
+
+    subparser = subparsers.add_parser("bake", help = "Write the model files of settings.json into a single pre-baked artifact")
+    subparser.add_argument("--out", required = True, help = "Artifact file to write, set it as artifactFile in settings.json to use it")
+
+    subparser = subparsers.add_parser("tune", help = "Find the fastest DNN backend, target, thread count and batch size and save them in settings.json")
+    subparser.add_argument("--network", choices = ["standin", "caffe"], default = "caffe", help = "Caffe model in settings.json or the generated stand-in network")
+    subparser.add_argument("--size", default = "640x480", help = "Resolution of the synthetic images")
+    subparser.add_argument("--repeat", type = int, default = 5, help = "Measured runs per configuration")
+    subparser.add_argument("--jobs", type = int, default = 1, help = "Worker processes that will share this host, limits the threads per worker")
+    subparser.add_argument("--threads", help = "Comma separated thread counts to try (default: powers of two up to the cores per worker)")
+    subparser.add_argument("--batches", default = "1,2,4,8,16", help = "Comma separated batch sizes to try")
+    subparser.add_argument("--dry-run", action = "store_true", help = "Only report the results, do not change settings.json")
+    subparser.add_argument("--summary", help = "Also write the JSON report to this file")
+    return parser
+
+# Function to run the headless command, returns the process exit code
+def runHeadless(argv = None):
+    args = buildParser().parse_args(argv)
+    if args.mode == "bake":
+        data = loadSettings()
+        startTime = time.perf_counter()
+        bakeArtifact(args.out, data["modelPath"], data["prototxtPath"], data["clusterPath"])
+        print(json.dumps({"artifact": args.out, "bytes": path.getsize(args.out), "seconds": round(time.perf_counter() - startTime, 4)}, indent = 2))
+        return 0
+
+    # Only imported by their own commands to keep the startup of the batch mode short
+    if args.mode == "tune":
+        from .Benchmark import parseSizes, writeReport
+        from .Tuning import runTuning, saveTuning
+        threadCounts = [int(value) for value in args.threads.split(",")] if args.threads else None
+        report = runTuning(args.network, parseSizes(args.size)[0], args.repeat, args.jobs, threadCounts, [int(value) for value in args.batches.split(",")])
+        if not args.dry_run:
+            saveTuning(report)
+        report["saved"] = not args.dry_run
+        print(json.dumps(report, indent = 2))
+        if args.summary:
+            writeReport(report, args.summary)
+        return 0
+
+    if args.mode == "benchmark":
+        from .Benchmark import parseSizes, runBenchmark, writeReport
+        report = runBenchmark(args.network, parseSizes(args.sizes), args.repeat, args.batch, parseSizes(args.video_size)[0], args.frames, inference = args.inference)
+        print(json.dumps(report, indent = 2))
+        if args.summary:
+            writeReport(report, args.summary)
+        return 0
+
+    if args.mode == "sync":
+        return runSync(args)
+
+    if args.mode == "pipe":
+        from .RawPipe import pipeFrames
+        setDNNOptions(dnnOptionsOf(args))
+        startTime = time.perf_counter()
+        try:
+            frameCount = pipeFrames(sys.stdin.buffer, sys.stdout.buffer, args.width, args.height, getEngine(), args.batch, args.temporal, args.profile)
+        except ValueError as instance:
+            # Truncated last frame or a frame size that does not match the stream
+            print(instance, file = sys.stderr)
+            return 2
+        # stdout carries the frames, the summary goes to stderr
+        seconds = time.perf_counter() - startTime
+        print(json.dumps({"mode": "pipe", "frames": frameCount, "seconds": round(seconds, 4), "fps": round(frameCount / seconds, 4) if seconds > 0 else 0.0}), file = sys.stderr)
+        return 0
+
+    if args.mode == "live":
+        return runLive(args)
+
+    if args.mode == "serve":
+        from .Server import serve
+        setDNNOptions(dnnOptionsOf(args))
+        engine = getEngine()
+        if args.profile:
+            engine.setProfile(args.profile)
+        serve(engine, args.host, args.port,
+              maxConcurrentRequests = args.max_concurrent,
+              maxBatchSize = args.max_batch,
+              batchWindow = args.batch_window / 1000 if args.batch_window is not None else None,
+              queueSize = args.queue_size)
+        return 0
+
+    outputPath = args.out if args.out is not None else loadSettings()["outputPath"]
+
+    inputs = collectInputs(args.inputs, args.mode, args.recursive)
+    if len(inputs) == 0:
+        print(f"No {args.mode} found for: {' '.join(args.inputs)}", file = sys.stderr)
+        return 2
+
+    options = {
+        "temporal": getattr(args, "temporal", None),
+        "shards": getattr(args, "shards", 1),
+        "segmentFrames": getattr(args, "segment_frames", None),
+        "memory": getattr(args, "memory", None) and args.memory * 1024 * 1024,
+        "jobs": args.jobs,
+        "metrics": args.metrics is not None,
+        "dnn": dnnOptionsOf(args, args.jobs),
+        "profile": args.profile,
+        "encoder": encoderOptionsOf(args),
+        "renditions": loadSpec(args.renditions) if args.mode == "images" else None
+    }
+    tasks = [(args.mode, inputFile, path.join(outputPath, subFolder), options) for inputFile, subFolder in inputs]
+    startTime = time.perf_counter()
+    # Sharded videos use the worker processes for their frame ranges instead
+    if args.jobs > 1 and options["shards"] <= 1:
+        with Pool(min(args.jobs, len(tasks)), initializer = initWorker, initargs = (options["dnn"],)) as pool:
+            results = pool.map(runTask, tasks, chunksize = 1)
+    else:
+        setDNNOptions(options["dnn"])
+        results = [runTask(task) for task in tasks]
+
+    failed = sum(result["status"] != "ok" for result in results)
+    # Add up the timings of every task, they may come from different worker processes
+    metrics = Metrics()
+    for result in results:
+        metrics.merge(result.pop("metrics", {}))
+    summary = {
+        "mode": args.mode,
+        "total": len(results),
+        "succeeded": len(results) - failed,
+        "failed": failed,
+        "jobs": args.jobs,
+        "seconds": round(time.perf_counter() - startTime, 4),
+        "results": results
+    }
+    if args.metrics:
+        summary["metrics"] = metrics.summary()
+        with open(args.metrics, "w") as outputfile:
+            outputfile.write(metrics.toPrometheus() if args.metrics.endswith(".prom") else metrics.toJSON())
+    print(json.dumps(summary, indent = 2))
+    if args.summary:
+        with open(args.summary, "w") as outputfile:
+            json.dump(summary, outputfile, indent = 2)
+
+    return 1 if failed > 0 else 0
+
+# Function to run the live colorization of a camera or stream, returns the process exit code
+def runLive(args):
+    from .Benchmark import parseSizes
+    from .Live import LiveColorizer, syntheticCamera
+    setDNNOptions(dnnOptionsOf(args))
+    source = args.source
+    if args.synthetic:
+        frameWidth, frameHeight = parseSizes(args.synthetic)[0]
+        source = syntheticCamera(frameWidth, frameHeight, args.fps)
+        if args.duration is None and args.frames is None:
+            args.duration = 10
+
+    # Function to display a colorized frame, returns False to stop
+    def show(colorizedFrame):
+        cv.imshow("Colorization", colorizedFrame)
+        return cv.waitKey(1) & 0xFF not in (ord("q"), 27)
+
+    liveColorizer = LiveColorizer(getEngine(), args.latency / 1000 if args.latency is not None else None, args.profile, False if args.fixed_size else None)
+    try:
+        stats = liveColorizer.run(source, show if args.show else None, args.duration, args.frames)
+    except ValueError as instance:
+        print(instance, file = sys.stderr)
+        return 2
+    except KeyboardInterrupt:
+        stats = liveColorizer.stats()
+    finally:
+        if args.show:
+            cv.destroyAllWindows()
+    stats["mode"] = "live"
+    print(json.dumps(stats, indent = 2))
+    if args.summary:
+        with open(args.summary, "w") as outputfile:
+            json.dump(stats, outputfile, indent = 2)
+    return 0
+
+# Function to run an incremental sync of a folder, returns the process exit code
+def runSync(args):
+    from .Sync import SyncManifest, fileHash, planSync, scanFolder, syncFingerprint
+    startTime = time.perf_counter()
+    data = loadSettings()
+    outputPath = args.out if args.out is not None else data["outputPath"]
+    if not path.isdir(args.input):
+        print(f"Input folder not found: {args.input}", file = sys.stderr)
+        return 2
+
+    manifest = SyncManifest(outputPath)
+    fingerprint, modelFiles = syncFingerprint(manifest, data)
+    syncOptions = {"profile": args.profile or data.get("profile", "standard")}
+    spec = loadSpec(args.renditions)
+    if spec != defaultSpec:
+        syncOptions["renditions"] = spec
+    pending, unchanged, vanished = planSync(manifest, scanFolder(args.input, extensions["images"]), fingerprint, syncOptions, args.hash)
+    if (manifest.fingerprint, manifest.options) != (fingerprint, syncOptions):
+        # Outputs of the previous model or options, only the vanished ones are kept to be reported or pruned
+        manifest.entries = {relativePath: manifest.entries[relativePath] for relativePath in vanished}
+    if (manifest.fingerprint, manifest.modelFiles, manifest.options) != (fingerprint, modelFiles, syncOptions):
+        manifest.changed = True
+    manifest.fingerprint, manifest.modelFiles, manifest.options = fingerprint, modelFiles, syncOptions
+
+    pruned = []
+    if args.prune:
+        for relativePath in vanished:
+            entry = manifest.entries.pop(relativePath)
+            manifest.changed = True
+            for outputFile in entry.get("renditions", [entry.get("output")]):
+                if outputFile and path.isfile(outputFile):
+                    os.remove(outputFile)
+                    pruned.append(outputFile)
+
+    options = {"jobs": args.jobs, "profile": syncOptions["profile"], "dnn": dnnOptionsOf(args, args.jobs), "renditions": spec}
+    pendingFiles = {inputFile: (relativePath, size, mtime) for relativePath, inputFile, size, mtime in pending}
+    tasks = [("images", inputFile, path.join(outputPath, path.dirname(relativePath)), options) for relativePath, inputFile, size, mtime in pending]
+    results = []
+
+    # Function to record a finished image in the manifest
+    def record(result):
+        relativePath, size, mtime = pendingFiles[result["input"]]
+        if result["status"] == "ok":
+            entry = {"size": size, "mtime": mtime, "output": result["output"]}
+            if "renditions" in result:
+                entry["renditions"] = result["renditions"]
+            if args.hash:
+                entry["hash"] = fileHash(result["input"])
+            manifest.entries[relativePath] = entry
+        else:
+            # Colorized again by the next run
+            manifest.entries.pop(relativePath, None)
+        manifest.changed = True
+        results.append(result)
+        # Keep the progress of long runs in case they are interrupted
+        manifest.checkpoint()
+
+    if len(tasks) > 0 and args.jobs > 1:
+        with Pool(min(args.jobs, len(tasks)), initializer = initWorker, initargs = (options["dnn"],)) as pool:
+            for result in pool.imap_unordered(runTask, tasks, chunksize = 4):
+                record(result)
+    elif len(tasks) > 0:
+        setDNNOptions(options["dnn"])
+        for task in tasks:
+            record(runTask(task))
+    # Nothing is written when the run changed nothing
+    manifest.checkpoint(final = True)
+
+    failed = sum(result["status"] != "ok" for result in results)
+    summary = {
+        "mode": "sync",
+        "processed": len(results) - failed,
+        "failed": failed,
+        "unchanged": unchanged,
+        "vanished": vanished,
+        "pruned": pruned,
+        "jobs": args.jobs,
+        "seconds": round(time.perf_counter() - startTime, 4),
+        "results": results
+    }
+    print(json.dumps(summary, indent = 2))
+    if args.summary:
+        with open(args.summary, "w") as outputfile:
+            json.dump(summary, outputfile, indent = 2)
+    return 1 if failed > 0 else 0
@@ -0,0 +1,158 @@
+"""
+Strip-based colorization of very large images under a memory budget
+The network only sees a small downscale (224x224 by default), so the low resolution AB result is computed once
+for the whole image and the full resolution output is then reconstructed strip by strip.
+Only the 8-bit input and output stay in memory; binary PPM files (.ppm) are memory mapped
+on input and streamed on output, so they are never fully loaded.
+"""
+
+import numpy as np
+import cv2 as cv
+from os import path
+from .Settings import loadSettings
+
+# Approximate float32 working memory per output pixel of a strip (LAB, AB and BGR buffers)
+bytesPerPixel = 32
+
+# Function to return the memory budget in bytes from settings.json
+def memoryBudget():
+    return int(loadSettings().get("memoryBudgetMB", 512) * 1024 * 1024)
+
+# Function to check whether an image of the given size exceeds the budget of a full frame reconstruction
+def needsStrips(imageHeight, imageWidth, budget):
+    return imageHeight * imageWidth * bytesPerPixel > budget
+
+# Function to memory map a binary 8-bit PPM (P6) file as a height x width x 3 RGB array
+def mapPPM(inputFile):
+    with open(inputFile, "rb") as file:
+        fields = []
+        while len(fields) < 4:
+            line = file.readline()
+            if not line:
+                raise ValueError(f"Truncated PPM header: {inputFile}")
+            fields.extend(line.split(b"#")[0].split())
+        offset = file.tell()
+    if fields[0] != b"P6" or int(fields[3]) != 255:
+        raise ValueError(f"Only 8-bit binary PPM (P6) files are supported: {inputFile}")
+    imageWidth, imageHeight = int(fields[1]), int(fields[2])
+    return np.memmap(inputFile, "uint8", "r", offset, (imageHeight, imageWidth, 3))
+
+# Writer streaming strips into a binary PPM file
+class PPMWriter:
+
+    def __init__(self, outputFile, imageHeight, imageWidth):
+        self.file = open(outputFile, "wb")
+        self.file.write(f"P6\n{imageWidth} {imageHeight}\n255\n".encode())
+
+    def write(self, rowStart, colorizedStrip):
+        # PPM stores RGB, the strips are BGR
+        self.file.write(np.ascontiguousarray(colorizedStrip[:, :, ::-1]).tobytes())
+
+    def close(self):
+        self.file.close()
+
+# Writer filling a full size 8-bit output image, saved with cv.imwrite at the end
+class ArrayWriter:
+
+    def __init__(self, outputFile, imageHeight, imageWidth):
+        self.outputFile = outputFile
+        self.outputImage = np.empty((imageHeight, imageWidth, 3), "uint8")
+
+    def write(self, rowStart, colorizedStrip):
+        self.outputImage[rowStart:rowStart + colorizedStrip.shape[0]] = colorizedStrip
+
+    def close(self):
+        if self.outputFile is not None and not cv.imwrite(self.outputFile, self.outputImage):
+            raise ValueError(f"Unable to write image: {self.outputFile}")
+
+# Function to return the source positions and weights of a bilinear cv.resize along one axis
+def linearTaps(sourceSize, targetSize):
+    coordinates = (np.arange(targetSize, dtype = "float64") + 0.5) * (sourceSize / targetSize) - 0.5
+    lower = np.floor(coordinates).astype("int64")
+    weights = coordinates - lower
+    # Border handling of OpenCV
+    weights[lower < 0] = 0
+    lower[lower < 0] = 0
+    weights[lower >= sourceSize - 1] = 0
+    lower[lower >= sourceSize - 1] = sourceSize - 1
+    return lower, np.minimum(lower + 1, sourceSize - 1), weights.astype("float32")
+
+# Function to compute the AB result of the whole image with the same network input as ColorizationEngine.preprocess
+# The bilinear resize of the LAB image only reads two rows and two columns around every sample,
+# so only those pixels are converted to LAB instead of the full image
+def predictGlobalAB(engine, image, rgbInput = False, profile = None):
+    imageHeight, imageWidth = image.shape[:2]
+    networkWidth, networkHeight = engine.networkSize(imageHeight, imageWidth, profile)
+    rowsLower, rowsUpper, rowWeights = linearTaps(imageHeight, networkHeight)
+    columnsLower, columnsUpper, columnWeights = linearTaps(imageWidth, networkWidth)
+    samples = image[np.concatenate((rowsLower, rowsUpper))][:, np.concatenate((columnsLower, columnsUpper))]
+    if rgbInput:
+        samples = samples[:, :, ::-1]
+    with engine.metrics.time("normalize"):
+        L_samples = cv.cvtColor(np.divide(samples, np.float32(255.0), dtype = "float32"), cv.COLOR_BGR2LAB)[:, :, 0]
+    with engine.metrics.time("resize"):
+        L_rows = L_samples[:, :networkWidth] * (1 - columnWeights) + L_samples[:, networkWidth:] * columnWeights
+        # Extract L channel and subtract 50 for mean-centering
+        L = L_rows[:networkHeight] * (1 - rowWeights[:, np.newaxis]) + L_rows[networkHeight:] * rowWeights[:, np.newaxis] - 50
+    return engine.predictAB(L)
+
+# Function to colorize an 8-bit BGR image strip by strip, every strip is passed to writer.write
+def colorizeStrips(engine, image, writer, budget = None, AB_result = None, rgbInput = False, profile = None):
+    budget = budget or memoryBudget()
+    imageHeight, imageWidth = image.shape[:2]
+    stripHeight = max(1, min(imageHeight, budget // (imageWidth * bytesPerPixel)))
+
+    if AB_result is None:
+        AB_result = predictGlobalAB(engine, image, rgbInput, profile)
+    # Linear interpolation is separable: resize AB to the full width once, then blend rows per strip
+    abHeight = AB_result.shape[0]
+    widthAB = cv.resize(AB_result, (imageWidth, abHeight))
+    rowScale = abHeight / imageHeight
+
+    colorizedStrip = None
+    for rowStart in range(0, imageHeight, stripHeight):
+        rowEnd = min(rowStart + stripHeight, imageHeight)
+        strip = np.asarray(image[rowStart:rowEnd])
+        if rgbInput:
+            strip = strip[:, :, ::-1]
+
+        # Source rows of the AB result, same pixel center convention as cv.resize
+        sourceRows = np.clip((np.arange(rowStart, rowEnd, dtype = "float32") + 0.5) * rowScale - 0.5, 0, abHeight - 1)
+        upperRows = sourceRows.astype("int32")
+        lowerRows = np.minimum(upperRows + 1, abHeight - 1)
+        weights = (sourceRows - upperRows)[:, np.newaxis, np.newaxis]
+        stripAB = widthAB[upperRows] * (1 - weights) + widthAB[lowerRows] * weights
+
+        # Only the LAB conversion of preprocess, the network input comes from predictGlobalAB
+        labStrip = engine.buffers.get("labstrip", strip.shape[:2] + (3,))
+        with engine.metrics.time("normalize"):
+            np.divide(strip, np.float32(255.0), out = labStrip)
+            cv.cvtColor(labStrip, cv.COLOR_BGR2LAB, dst = labStrip)
+        if colorizedStrip is None or colorizedStrip.shape[0] != rowEnd - rowStart:
+            colorizedStrip = np.empty((rowEnd - rowStart, imageWidth, 3), "uint8")
+        # Own buffer slot, so the strips do not replace the full frame buffers of the engine
+        engine.reconstruct(labStrip, stripAB.astype("float32", copy = False), colorizedStrip, slot = "strip")
+        writer.write(rowStart, colorizedStrip)
+
+    return AB_result
+
+# Function to colorize a large image file into outputFile under the memory budget
+def colorizeLargeImage(engine, inputFile, outputFile, budget = None, profile = None):
+    rgbInput = path.splitext(inputFile)[1].lower() in (".ppm", ".pnm")
+    if rgbInput:
+        image = mapPPM(inputFile)
+    else:
+        image = cv.imread(inputFile)
+        if image is None:
+            raise ValueError(f"Unable to read image: {inputFile}")
+
+    imageHeight, imageWidth = image.shape[:2]
+    if path.splitext(outputFile)[1].lower() in (".ppm", ".pnm"):
+        writer = PPMWriter(outputFile, imageHeight, imageWidth)
+    else:
+        writer = ArrayWriter(outputFile, imageHeight, imageWidth)
+    try:
+        colorizeStrips(engine, image, writer, budget, rgbInput = rgbInput, profile = profile)
+    finally:
+        writer.close()
+    return outputFile
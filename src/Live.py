@@ -0,0 +1,192 @@
+"""
+Latency-bounded colorization of a live camera or stream
+A capture thread only keeps the newest frame of the source, so when the forward pass falls behind
+the stale frames are dropped instead of queued and the lag stays bounded. With adaptive sizing the
+network input steps down through the profiles while the end-to-end latency (capture to colorized
+frame) exceeds the target, and back up once the larger input is expected to meet it again.
+The run reports the achieved fps, the drop rate and the latency percentiles.
+"""
+
+import threading
+import time
+from collections import deque
+import cv2 as cv
+import numpy as np
+from .Benchmark import syntheticImage
+from .Engine import getEngine, profiles
+from .Pipeline import IterableCapture
+from .Settings import loadSettings
+
+# Function to open a live source: a camera index ("0"), a stream URL or file, or an iterable of frames
+def openSource(source):
+    if isinstance(source, int) or (isinstance(source, str) and source.isdigit()):
+        videoCapture = cv.VideoCapture(int(source))
+    elif isinstance(source, str):
+        videoCapture = cv.VideoCapture(source)
+    else:
+        return IterableCapture(source)
+    if not videoCapture.isOpened():
+        raise ValueError(f"Unable to open live source: {source}")
+    return videoCapture
+
+# Function to generate the frames of a synthetic camera at a fixed rate, for tests without a device
+def syntheticCamera(frameWidth, frameHeight, fps = 25, frameCount = None):
+    images = [syntheticImage(frameWidth, frameHeight, seed) for seed in range(8)]
+    startTime = time.perf_counter()
+    index = 0
+    while frameCount is None or index < frameCount:
+        # Deliver every frame at its capture time, like a camera, whether or not it is consumed
+        delay = startTime + index / fps - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield images[index % len(images)].copy()
+        index += 1
+
+class LiveColorizer:
+
+    # Number of recent latencies the adaptive sizing decides on
+    window = 8
+
+    def __init__(self, engine = None, latencyTarget = None, profile = None, adaptive = None):
+        data = {}
+        if None in (latencyTarget, adaptive):
+            data = loadSettings()
+        self.engine = engine or getEngine()
+        # End-to-end latency the run aims to stay below, in seconds
+        self.latencyTarget = latencyTarget if latencyTarget is not None else data.get("liveLatencyMs", 200) / 1000
+        self.adaptive = adaptive if adaptive is not None else data.get("liveAdaptive", True)
+        profile = profile or self.engine.profile
+        self.engine.networkSize(224, 224, profile)
+        name, separator, mode = profile.partition("-")
+        # Profiles the adaptive sizing steps through, from the smallest input up to the selected one
+        self.ladder = [candidate + separator + mode for candidate in sorted(profiles, key = profiles.get) if profiles[candidate] <= profiles[name]]
+        self.level = len(self.ladder) - 1
+        self.reset()
+
+    # Function to clear the counters and latencies before a run
+    def reset(self):
+        self.stopEvent = threading.Event()
+        self.captured = self.colorized = self.dropped = self.switches = 0
+        # Latencies of the last frames, a long run keeps constant memory
+        self.latencies = deque(maxlen = 10000)
+        self.recent = deque(maxlen = self.window)
+        self.startTime = self.endTime = time.perf_counter()
+
+    # Function to colorize a live source until it ends, duration seconds passed or frameCount frames were colorized
+    # sink is called with every colorized frame (display, writer), returns the stats of the run
+    def run(self, source, sink = None, duration = None, frameCount = None):
+        colorizedFrames = self.stream(source)
+        try:
+            for colorizedFrame in colorizedFrames:
+                if sink is not None and sink(colorizedFrame) is False:
+                    break
+                if frameCount and self.colorized >= frameCount:
+                    break
+                if duration and time.perf_counter() - self.startTime >= duration:
+                    break
+        finally:
+            colorizedFrames.close()
+        return self.stats()
+
+    # Function to colorize the newest frame of a live source whenever the network is free, yields the colorized frames
+    def stream(self, source):
+        videoCapture = openSource(source)
+        self.reset()
+        self.condition = threading.Condition()
+        self.errors = []
+        self.newest = None
+        self.finished = False
+
+        thread = threading.Thread(target = self.capture, args = (videoCapture,), daemon = True)
+        thread.start()
+        try:
+            while True:
+                with self.condition:
+                    while self.newest is None and not self.finished:
+                        self.condition.wait()
+                    if self.newest is None:
+                        break
+                    videoFrame, captureTime = self.newest
+                    self.newest = None
+                colorizedFrame = self.engine.colorize(videoFrame, self.ladder[self.level])
+                latency = time.perf_counter() - captureTime
+                self.latencies.append(latency)
+                self.colorized += 1
+                self.adapt(latency)
+                yield colorizedFrame
+        finally:
+            # Also stops the capture when the consumer closes the generator early
+            self.stopEvent.set()
+            thread.join()
+            self.endTime = time.perf_counter()
+            if hasattr(videoCapture, "release"):
+                videoCapture.release()
+
+        if self.errors:
+            raise self.errors[0]
+
+    # Capture stage: read frames as fast as the source delivers them, a frame not picked up in time is dropped
+    def capture(self, videoCapture):
+        try:
+            while not self.stopEvent.is_set():
+                videoCapturing, videoFrame = videoCapture.read()
+                if not videoCapturing:
+                    break
+                with self.condition:
+                    if self.newest is not None:
+                        self.dropped += 1
+                    self.newest = (videoFrame, time.perf_counter())
+                    self.captured += 1
+                    self.condition.notify()
+        except Exception as instance:
+            self.errors.append(instance)
+        finally:
+            with self.condition:
+                self.finished = True
+                self.condition.notify()
+
+    # Function to step the network input down while the latency exceeds the target, and back up
+    # once the recent latencies scaled to the larger input stay below it
+    def adapt(self, latency):
+        if not self.adaptive:
+            return
+        self.recent.append(latency)
+        if len(self.recent) >= 3 and np.median(self.recent) > self.latencyTarget and self.level > 0:
+            self.level -= 1
+        elif len(self.recent) == self.window and self.level < len(self.ladder) - 1:
+            # The forward pass grows with the input area
+            growth = (profiles[self.ladder[self.level + 1].partition("-")[0]] / profiles[self.ladder[self.level].partition("-")[0]]) ** 2
+            if max(self.recent) * growth > 0.8 * self.latencyTarget:
+                return
+            self.level += 1
+        else:
+            return
+        self.recent.clear()
+        self.switches += 1
+
+    # Function to return the achieved fps, drop rate and latency percentiles (ms) of the current or last run
+    def stats(self):
+        seconds = (time.perf_counter() if not self.stopEvent.is_set() else self.endTime) - self.startTime
+        latencies = np.asarray(self.latencies) * 1000
+        latencyMs = {"target": round(self.latencyTarget * 1000, 3)}
+        if len(latencies) > 0:
+            latencyMs.update({
+                "mean": round(float(latencies.mean()), 3),
+                "p50": round(float(np.percentile(latencies, 50)), 3),
+                "p90": round(float(np.percentile(latencies, 90)), 3),
+                "p99": round(float(np.percentile(latencies, 99)), 3),
+                "max": round(float(latencies.max()), 3)
+            })
+        return {
+            "seconds": round(seconds, 4),
+            "captured": self.captured,
+            "colorized": self.colorized,
+            "dropped": self.dropped,
+            "dropRate": round(self.dropped / self.captured, 4) if self.captured else 0.0,
+            "captureFps": round(self.captured / seconds, 4) if seconds > 0 else 0.0,
+            "fps": round(self.colorized / seconds, 4) if seconds > 0 else 0.0,
+            "latencyMs": latencyMs,
+            "adaptive": self.adaptive,
+            "profile": self.ladder[self.level],
+            "profileSwitches": self.switches
+        }
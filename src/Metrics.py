@@ -0,0 +1,142 @@
+"""
+Opt-in per-stage timing of the colorization pipeline
+Stages (decode, normalize, resize, forward, upsample, lab2bgr, encode) are timed with
+"with metrics.time(stage):" blocks. Every timing is passed to the registered callbacks and
+accumulated into counters that can be exported as JSON or as Prometheus text.
+"""
+
+import json
+import threading
+import time
+
+# Pipeline stages in the order they run
+stages = ["decode", "normalize", "resize", "forward", "upsample", "lab2bgr", "encode"]
+
+# Context manager timing one execution of a stage
+class StageTimer:
+
+    def __init__(self, metrics, stage, items):
+        self.metrics = metrics
+        self.stage = stage
+        self.items = items
+
+    def __enter__(self):
+        self.startTime = time.perf_counter()
+        return self
+
+    def __exit__(self, *exception):
+        self.metrics.record(self.stage, time.perf_counter() - self.startTime, self.items)
+
+class Metrics:
+
+    enabled = True
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.callbacks = []
+        self.reset()
+
+    # Function to clear all timings and counters
+    def reset(self):
+        with self.lock:
+            self.stages = {}
+            self.counters = {}
+
+    # Function to register callback(stage, seconds, items) called after every timed stage
+    def addCallback(self, callback):
+        self.callbacks.append(callback)
+
+    # Function to time a stage processing the given number of items (images or frames)
+    def time(self, stage, items = 1):
+        return StageTimer(self, stage, items)
+
+    # Function to add one timing of a stage
+    def record(self, stage, seconds, items = 1):
+        with self.lock:
+            entry = self.stages.setdefault(stage, {"count": 0, "items": 0, "seconds": 0.0, "maxSeconds": 0.0})
+            entry["count"] += 1
+            entry["items"] += items
+            entry["seconds"] += seconds
+            entry["maxSeconds"] = max(entry["maxSeconds"], seconds)
+        for callback in self.callbacks:
+            callback(stage, seconds, items)
+
+    # Function to increase a named counter
+    def increment(self, name, value = 1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    # Function to add the summary of another Metrics (e.g. of a worker process)
+    def merge(self, summary):
+        with self.lock:
+            for stage, other in summary.get("stages", {}).items():
+                entry = self.stages.setdefault(stage, {"count": 0, "items": 0, "seconds": 0.0, "maxSeconds": 0.0})
+                entry["count"] += other["count"]
+                entry["items"] += other["items"]
+                entry["seconds"] += other["seconds"]
+                entry["maxSeconds"] = max(entry["maxSeconds"], other["maxSeconds"])
+            for name, value in summary.get("counters", {}).items():
+                self.counters[name] = self.counters.get(name, 0) + value
+
+    # Function to return the timings and counters as a dictionary
+    def summary(self):
+        with self.lock:
+            order = {stage: i for i, stage in enumerate(stages)}
+            summary = {"stages": {}, "counters": dict(self.counters)}
+            for stage in sorted(self.stages, key = lambda stage: (order.get(stage, len(order)), stage)):
+                entry = dict(self.stages[stage])
+                entry["meanSeconds"] = entry["seconds"] / entry["count"]
+                entry["itemsPerSecond"] = entry["items"] / entry["seconds"] if entry["seconds"] > 0 else 0.0
+                summary["stages"][stage] = entry
+            return summary
+
+    # Function to export the summary as JSON
+    def toJSON(self):
+        return json.dumps(self.summary(), indent = 2)
+
+    # Function to export the summary in the Prometheus text exposition format
+    def toPrometheus(self, prefix = "colorization"):
+        summary = self.summary()
+        lines = [
+            f"# HELP {prefix}_stage_seconds Time spent in each pipeline stage",
+            f"# TYPE {prefix}_stage_seconds summary"
+        ]
+        for stage, entry in summary["stages"].items():
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {entry["seconds"]:.6f}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {entry["count"]}')
+        lines.append(f"# HELP {prefix}_stage_max_seconds Longest single execution of each pipeline stage")
+        lines.append(f"# TYPE {prefix}_stage_max_seconds gauge")
+        for stage, entry in summary["stages"].items():
+            lines.append(f'{prefix}_stage_max_seconds{{stage="{stage}"}} {entry["maxSeconds"]:.6f}')
+        lines.append(f"# HELP {prefix}_stage_items_total Images or frames processed by each pipeline stage")
+        lines.append(f"# TYPE {prefix}_stage_items_total counter")
+        for stage, entry in summary["stages"].items():
+            lines.append(f'{prefix}_stage_items_total{{stage="{stage}"}} {entry["items"]}')
+        for name, value in summary["counters"].items():
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+# Shared no-op context manager of NullMetrics
+class NullTimer:
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        return False
+
+# Metrics used while instrumentation is disabled, every call is a no-op
+class NullMetrics(Metrics):
+
+    enabled = False
+    timer = NullTimer()
+
+    def time(self, stage, items = 1):
+        return self.timer
+
+    def record(self, stage, seconds, items = 1):
+        pass
+
+    def increment(self, name, value = 1):
+        pass
@@ -0,0 +1,197 @@
+"""
+Staged video colorization pipeline
+A decoder thread, one or more inference workers and an ordered encoder thread are connected
+by bounded queues, so decoding and encoding overlap with the forward pass of the CNN.
+The same stages also colorize any iterable of frames as a generator (stream, colorizeFrames).
+"""
+
+import queue
+import threading
+from .Engine import getEngine
+from .Settings import loadSettings
+from .Temporal import TemporalColorizer
+
+# Marker passed through the queues once the decoder has read the last frame
+_endOfStream = None
+
+# Capture wrapper reading the frames of an iterator
+class IterableCapture:
+
+    def __init__(self, frames):
+        self.frames = iter(frames)
+
+    def read(self):
+        for videoFrame in self.frames:
+            return True, videoFrame
+        return False, None
+
+class VideoPipeline:
+
+    def __init__(self, engine, queueSize = None, inferenceWorkers = None, batchSize = None, colorizer = None, profile = None):
+        data = {}
+        if None in (queueSize, inferenceWorkers):
+            data = loadSettings()
+        self.engine = engine
+        # Maximum number of batches waiting between two stages, a full queue blocks the stage before it
+        self.queueSize = queueSize or data.get("queueSize", 4)
+        # Number of threads running the pre-processing, forward pass and reconstruction
+        self.inferenceWorkers = inferenceWorkers or data.get("inferenceWorkers", 2)
+        self.batchSize = batchSize or engine.batchSize
+        # Object colorizing the batches, a stateful colorizer needs the batches in order on a single worker
+        self.colorizer = colorizer if colorizer is not None else engine
+        if colorizer is not None:
+            self.inferenceWorkers = 1
+        # Speed/quality profile of the network input, the engine default when None
+        self.profile = profile
+
+    # Function to colorize the frames of videoCapture into videoWriter, progress is called with the number of frames written
+    def run(self, videoCapture, videoWriter, progress = None):
+        threads = self.start(videoCapture)
+        threads.append(threading.Thread(target = self.encode, args = (videoWriter, progress), daemon = True))
+        threads[-1].start()
+        for thread in threads:
+            thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+    # Function to lazily colorize an iterable of BGR frames, yields the colorized frames in order
+    # At most queueSize batches wait between the stages, so the frames are read as they are consumed.
+    # The frames are kept until they are colorized, a source must not reuse their buffers.
+    def stream(self, frames):
+        threads = self.start(IterableCapture(frames))
+        try:
+            pendingBatches = {}
+            nextIndex = 0
+            finishedWorkers = 0
+            while finishedWorkers < self.inferenceWorkers:
+                received, item = self.get(self.encodeQueue)
+                if not received:
+                    break
+                if item is _endOfStream:
+                    finishedWorkers += 1
+                    continue
+                batchIndex, colorizedImages = item
+                pendingBatches[batchIndex] = colorizedImages
+                while nextIndex in pendingBatches:
+                    yield from pendingBatches.pop(nextIndex)
+                    nextIndex += 1
+        finally:
+            # Also stops the stages when the consumer closes the generator early
+            self.stopEvent.set()
+            for thread in threads:
+                thread.join()
+
+        if self.errors:
+            raise self.errors[0]
+
+    # Function to start the decoder and inference stages, returns their threads
+    def start(self, videoCapture):
+        self.decodeQueue = queue.Queue(self.queueSize)
+        self.encodeQueue = queue.Queue(self.queueSize)
+        self.errors = []
+        self.stopEvent = threading.Event()
+
+        threads = [threading.Thread(target = self.decode, args = (videoCapture,), daemon = True)]
+        threads += [threading.Thread(target = self.infer, daemon = True) for i in range(self.inferenceWorkers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    # Function to put an item on a queue while still reacting to a failure in another stage
+    def put(self, itemQueue, item):
+        while not self.stopEvent.is_set():
+            try:
+                itemQueue.put(item, timeout = 0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    # Function to get an item from a queue while still reacting to a failure in another stage
+    def get(self, itemQueue):
+        while not self.stopEvent.is_set():
+            try:
+                return True, itemQueue.get(timeout = 0.1)
+            except queue.Empty:
+                continue
+        return False, None
+
+    # Function to record the failure of a stage and stop the other stages
+    def fail(self, instance):
+        self.errors.append(instance)
+        self.stopEvent.set()
+
+    # Decoder stage: read frames and group them into numbered batches
+    def decode(self, videoCapture):
+        try:
+            metrics = self.engine.metrics
+            batchIndex = 0
+            with metrics.time("decode"):
+                videoCapturing, videoFrame = videoCapture.read()
+            while videoCapturing:
+                videoFrames = []
+                while videoCapturing and len(videoFrames) < self.batchSize:
+                    videoFrames.append(videoFrame)
+                    with metrics.time("decode"):
+                        videoCapturing, videoFrame = videoCapture.read()
+                if not self.put(self.decodeQueue, (batchIndex, videoFrames)):
+                    return
+                batchIndex += 1
+            # One marker per inference worker
+            for i in range(self.inferenceWorkers):
+                if not self.put(self.decodeQueue, _endOfStream):
+                    return
+        except Exception as instance:
+            self.fail(instance)
+
+    # Inference stage: colorize a batch of frames
+    def infer(self):
+        try:
+            while True:
+                received, item = self.get(self.decodeQueue)
+                if not received:
+                    return
+                if item is _endOfStream:
+                    self.put(self.encodeQueue, _endOfStream)
+                    return
+                batchIndex, videoFrames = item
+                if not self.put(self.encodeQueue, (batchIndex, self.colorizer.colorizeBatch(videoFrames, self.batchSize, self.profile))):
+                    return
+        except Exception as instance:
+            self.fail(instance)
+
+    # Encoder stage: write the batches back in their original order
+    def encode(self, videoWriter, progress):
+        try:
+            pendingBatches = {}
+            nextIndex = 0
+            finishedWorkers = 0
+            while finishedWorkers < self.inferenceWorkers:
+                received, item = self.get(self.encodeQueue)
+                if not received:
+                    return
+                if item is _endOfStream:
+                    finishedWorkers += 1
+                    continue
+                batchIndex, colorizedImages = item
+                pendingBatches[batchIndex] = colorizedImages
+                while nextIndex in pendingBatches:
+                    colorizedImages = pendingBatches.pop(nextIndex)
+                    with self.engine.metrics.time("encode", len(colorizedImages)):
+                        for colorizedImage in colorizedImages:
+                            videoWriter.write(colorizedImage)
+                    if progress is not None:
+                        progress(len(colorizedImages))
+                    nextIndex += 1
+        except Exception as instance:
+            self.fail(instance)
+
+# Function to colorize any iterable of BGR frames (camera, decoded stream, list) as a generator
+# batchSize 1 gives the lowest latency per frame, larger batches the highest throughput
+def colorizeFrames(frames, engine = None, batchSize = None, queueSize = None, temporalMode = "off", profile = None):
+    engine = engine or getEngine()
+    colorizer = None
+    if temporalMode not in (None, "off"):
+        colorizer = TemporalColorizer(engine, temporalMode = temporalMode, profile = profile)
+    return VideoPipeline(engine, queueSize, batchSize = batchSize, colorizer = colorizer, profile = profile).stream(frames)
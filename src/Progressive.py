@@ -0,0 +1,45 @@
+"""
+Progressive preview-then-full colorization for interactive use
+The forward pass runs once, on the same network input as ColorizationEngine.colorize. A low
+resolution preview is reconstructed from its AB result and delivered first, then the full resolution
+image is reconstructed from the same AB result (strip by strip when it exceeds the memory budget).
+The time to the first pixel is the forward pass, one resize of the input and a preview sized
+reconstruction, however large the input.
+"""
+
+from .LargeImage import ArrayWriter, colorizeStrips, memoryBudget, needsStrips, predictGlobalAB
+from .Renditions import fitSize, reconstructFrom, resizeTo
+from .Settings import loadSettings
+
+# Function to forward an image and downscale it to the preview size, returns (preview sized image, AB result)
+# previewSize is the longer side of the preview (default: previewSize in settings.json), it only
+# affects the preview: the network input is sampled from the full image like colorize does
+def predictPreviewAB(engine, image, previewSize = None, profile = None):
+    previewSize = previewSize or loadSettings().get("previewSize", 512)
+    imageHeight, imageWidth = image.shape[:2]
+    AB_result = predictGlobalAB(engine, image, profile = profile)
+    return resizeTo(image, fitSize(imageWidth, imageHeight, previewSize, previewSize)), AB_result
+
+# Function to reconstruct the full resolution image from the AB result, in strips above the memory budget
+def reconstructFull(engine, image, AB_result, budget = None):
+    budget = budget or memoryBudget()
+    imageHeight, imageWidth = image.shape[:2]
+    if needsStrips(imageHeight, imageWidth, budget):
+        writer = ArrayWriter(None, imageHeight, imageWidth)
+        colorizeStrips(engine, image, writer, budget, AB_result)
+        return writer.outputImage
+    return reconstructFrom(engine, image, AB_result, slot = 0)
+
+# Function to colorize an image progressively, yields ("preview", image) and then ("full", image)
+# The consumer can show the preview while the full resolution image is not reconstructed yet
+def colorizeProgressive(engine, image, previewSize = None, profile = None, budget = None):
+    previewImage, AB_result = predictPreviewAB(engine, image, previewSize, profile)
+    yield "preview", reconstructFrom(engine, previewImage, AB_result, slot = "preview")
+    yield "full", reconstructFull(engine, image, AB_result, budget)
+
+# Function to colorize an image progressively, onPreview is called with the preview
+# Returns (full image, AB result), the AB result can be reused for more renditions of the image
+def colorizeWithPreview(engine, image, onPreview, previewSize = None, profile = None, budget = None):
+    previewImage, AB_result = predictPreviewAB(engine, image, previewSize, profile)
+    onPreview(reconstructFrom(engine, previewImage, AB_result, slot = "preview"))
+    return reconstructFull(engine, image, AB_result, budget), AB_result
@@ -0,0 +1,42 @@
+"""
+Raw frame pipe mode for ffmpeg pipelines
+Raw BGR24 frames of a fixed width and height are read from a binary stream (stdin), colorized
+by the staged pipeline and written back as raw BGR24 frames (stdout), so the colorization can sit
+between two ffmpeg processes without intermediate files, for any container and codec:
+ffmpeg -i in.mkv -f rawvideo -pix_fmt bgr24 - | python main.py pipe --width W --height H |
+ffmpeg -f rawvideo -pix_fmt bgr24 -s WxH -r FPS -i - out.mkv
+"""
+
+import numpy as np
+from .Pipeline import colorizeFrames
+
+# Function to read raw BGR24 frames from a binary stream until it ends
+def readRawFrames(inputStream, frameWidth, frameHeight):
+    if frameWidth <= 0 or frameHeight <= 0:
+        raise ValueError(f"Invalid frame size: {frameWidth}x{frameHeight}")
+    frameBytes = frameWidth * frameHeight * 3
+    while True:
+        # A new array per frame, the pipeline keeps the frames until they are colorized
+        videoFrame = np.empty((frameHeight, frameWidth, 3), "uint8")
+        frameView = memoryview(videoFrame).cast("B")
+        bytesRead = 0
+        while bytesRead < frameBytes:
+            count = inputStream.readinto(frameView[bytesRead:])
+            if not count:
+                break
+            bytesRead += count
+        if bytesRead == 0:
+            return
+        if bytesRead < frameBytes:
+            raise ValueError(f"Truncated frame: {bytesRead} of {frameBytes} bytes, check --width and --height")
+        yield videoFrame
+
+# Function to colorize the raw frames of inputStream into outputStream, returns the number of frames
+def pipeFrames(inputStream, outputStream, frameWidth, frameHeight, engine = None, batchSize = None, temporalMode = "off", profile = None):
+    frameCount = 0
+    colorizedFrames = colorizeFrames(readRawFrames(inputStream, frameWidth, frameHeight), engine, batchSize, temporalMode = temporalMode, profile = profile)
+    for colorizedFrame in colorizedFrames:
+        outputStream.write(colorizedFrame.data)
+        frameCount += 1
+    outputStream.flush()
+    return frameCount
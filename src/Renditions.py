@@ -0,0 +1,140 @@
+"""
+Derivative renditions of a colorized image from a single forward pass
+The output spec ("renditions" in settings.json) lists the files written for every image: a suffix,
+an optional bounding box (width, height), a format with its quality and optionally a before/after
+comparison layout. The network runs once per image; every rendition is reconstructed straight from
+the low resolution AB result at its own size instead of downscaling the full resolution result,
+and the renditions are reconstructed and encoded concurrently.
+"""
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+import cv2 as cv
+import numpy as np
+from .LargeImage import ArrayWriter, colorizeStrips, memoryBudget, needsStrips, predictGlobalAB
+from .Settings import loadSettings
+
+# Output spec used when settings.json has none: the full size image in the format of the input
+defaultSpec = [{"suffix": "colorized"}]
+
+# Function to load an output spec from a JSON file, or from settings.json when no file is given
+def loadSpec(specFile = None):
+    if specFile:
+        with open(specFile) as file:
+            spec = json.load(file)
+    else:
+        spec = loadSettings().get("renditions", defaultSpec)
+    if not isinstance(spec, list) or len(spec) == 0:
+        raise ValueError("The output spec must be a non-empty list of renditions")
+    return spec
+
+# Function to return the output file of a rendition, in the format of the input unless the rendition sets one
+def renditionFile(inputFile, outputFolder, rendition):
+    name, extension = path.splitext(path.basename(inputFile))
+    imageFormat = rendition.get("format") or extension.lstrip(".") or "png"
+    return path.join(outputFolder, f"{name}_{rendition.get('suffix', 'colorized')}.{imageFormat.lower()}")
+
+# Function to return the cv.imwrite parameters of a rendition: quality (JPEG, WebP) or compression (PNG)
+def writeParameters(rendition, outputFile):
+    extension = path.splitext(outputFile)[1].lower()
+    if "quality" in rendition and extension in (".jpg", ".jpeg"):
+        return [cv.IMWRITE_JPEG_QUALITY, int(rendition["quality"])]
+    if "quality" in rendition and extension == ".webp":
+        return [cv.IMWRITE_WEBP_QUALITY, int(rendition["quality"])]
+    if "compression" in rendition and extension == ".png":
+        return [cv.IMWRITE_PNG_COMPRESSION, int(rendition["compression"])]
+    return []
+
+# Function to fit an image into a bounding box, returns (width, height)
+# A smaller image is only enlarged to the box with enlarge, the renditions never upscale
+def fitSize(imageWidth, imageHeight, maxWidth = None, maxHeight = None, enlarge = False):
+    scale = min((maxWidth or imageWidth) / imageWidth, (maxHeight or imageHeight) / imageHeight)
+    if not enlarge:
+        scale = min(1.0, scale)
+    return max(1, round(imageWidth * scale)), max(1, round(imageHeight * scale))
+
+# Function to resize a BGR image to (width, height), unchanged when it already has that size
+def resizeTo(image, size):
+    if size == (image.shape[1], image.shape[0]):
+        return image
+    # Area averaging to shrink, linear interpolation to enlarge
+    interpolation = cv.INTER_AREA if size[0] <= image.shape[1] else cv.INTER_LINEAR
+    return cv.resize(np.asarray(image), size, interpolation = interpolation)
+
+# Function to colorize a BGR image of any size with the low resolution AB result of the full image
+# slot selects the work buffers of the engine, so a small rendition does not shrink those of the full size one
+def reconstructFrom(engine, image, AB_result, slot = "rendition"):
+    labImage = engine.buffers.get(f"lab{slot}", image.shape[:2] + (3,))
+    np.divide(image, np.float32(255.0), out = labImage)
+    cv.cvtColor(labImage, cv.COLOR_BGR2LAB, dst = labImage)
+    return engine.reconstruct(labImage, AB_result, slot = slot)
+
+# Function to build the before/after comparison of an image within a bounding box, returns (image, layout)
+# layout "auto" stacks the images vertically when side by side would be scaled down more
+# enlarge scales a smaller image up to the bounding box (interactive display)
+def comparisonImage(engine, image, AB_result, maxWidth = None, maxHeight = None, layout = "auto", enlarge = False):
+    imageHeight, imageWidth = image.shape[:2]
+    if layout == "auto":
+        layout = "vertical" if ((maxWidth or 1920) / (imageWidth * 2)) < ((maxHeight or 1080) / (imageHeight * 2)) else "horizontal"
+    if layout == "vertical":
+        size = fitSize(imageWidth, imageHeight, maxWidth, maxHeight and maxHeight // 2, enlarge)
+    else:
+        size = fitSize(imageWidth, imageHeight, maxWidth and maxWidth // 2, maxHeight, enlarge)
+    originalImage = resizeTo(image, size)
+    colorizedImage = reconstructFrom(engine, originalImage, AB_result)
+    return (np.vstack if layout == "vertical" else np.hstack)((originalImage, colorizedImage)), layout
+
+# Function to check whether a rendition is the full size colorized image
+def isFullSize(rendition, imageWidth, imageHeight):
+    return not rendition.get("comparison") and fitSize(imageWidth, imageHeight, rendition.get("width"), rendition.get("height")) == (imageWidth, imageHeight)
+
+# Function to write every rendition of the spec for an image, returns the written files
+# colorizedImage is the full size result when it was already reconstructed
+def writeRenditions(engine, image, AB_result, inputFile, outputFolder, spec = None, colorizedImage = None, budget = None):
+    spec = spec or loadSpec()
+    imageHeight, imageWidth = image.shape[:2]
+
+    # Function to reconstruct and write a single rendition
+    def write(rendition):
+        outputFile = renditionFile(inputFile, outputFolder, rendition)
+        if not cv.haveImageWriter(outputFile):
+            raise ValueError(f"Unsupported image format: {outputFile}")
+        if rendition.get("comparison"):
+            outputImage = comparisonImage(engine, image, AB_result, rendition.get("width"), rendition.get("height"), rendition["comparison"])[0]
+        elif not isFullSize(rendition, imageWidth, imageHeight):
+            outputImage = reconstructFrom(engine, resizeTo(image, fitSize(imageWidth, imageHeight, rendition.get("width"), rendition.get("height"))), AB_result)
+        elif colorizedImage is not None:
+            outputImage = colorizedImage
+        else:
+            # Full size image too large for the memory budget
+            writer = ArrayWriter(None, imageHeight, imageWidth)
+            colorizeStrips(engine, image, writer, budget, AB_result)
+            outputImage = writer.outputImage
+        with engine.metrics.time("encode"):
+            written = cv.imwrite(outputFile, outputImage, writeParameters(rendition, outputFile))
+        if not written:
+            raise ValueError(f"Unable to write image: {outputFile}")
+        return outputFile
+
+    if len(spec) == 1:
+        return [write(spec[0])]
+    # Resizing, color conversion and encoding release the GIL, the renditions run in parallel
+    with ThreadPoolExecutor(len(spec)) as executor:
+        return list(executor.map(write, spec))
+
+# Function to colorize an image with a single forward pass and write every rendition of the spec, returns the written files
+def colorizeRenditions(engine, image, inputFile, outputFolder, spec = None, profile = None, budget = None):
+    spec = spec or loadSpec()
+    budget = budget or memoryBudget()
+    imageHeight, imageWidth = image.shape[:2]
+    if needsStrips(imageHeight, imageWidth, budget):
+        AB_result = predictGlobalAB(engine, image, profile = profile)
+        return writeRenditions(engine, image, AB_result, inputFile, outputFolder, spec, budget = budget)
+
+    labImage, L = engine.preprocess(image, profile = profile)
+    AB_result = engine.predictAB(L)
+    colorizedImage = None
+    if any(isFullSize(rendition, imageWidth, imageHeight) for rendition in spec):
+        colorizedImage = engine.reconstruct(labImage, AB_result)
+    return writeRenditions(engine, image, AB_result, inputFile, outputFolder, spec, colorizedImage, budget)
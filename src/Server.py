@@ -0,0 +1,295 @@
+"""
+Local HTTP colorization service
+POST /colorize with an encoded image as the request body returns the colorized image
+(?format=png|jpg|webp, default: format of the input; ?profile=preview|standard|high|... selects
+the network input size). GET /health and GET /metrics
+(?format=prometheus for the text exposition format) report the state of the service. Concurrent requests are coalesced into batched forward passes
+by a micro-batcher holding the warm network.
+"""
+
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import cv2 as cv
+import numpy as np
+from .Engine import profileNames
+from .Settings import loadSettings
+
+# Image formats the service can answer with, keyed by their ?format= value
+formats = {
+    "png": (".png", "image/png"),
+    "jpg": (".jpg", "image/jpeg"),
+    "jpeg": (".jpg", "image/jpeg"),
+    "webp": (".webp", "image/webp")
+}
+
+# Function to detect the format of an encoded image from its signature, png when unknown
+def detectFormat(body):
+    if body[:3] == b"\xff\xd8\xff":
+        return "jpg"
+    if body[:4] == b"RIFF" and body[8:12] == b"WEBP":
+        return "webp"
+    return "png"
+
+# Error raised when the request queue of the micro-batcher is full
+class QueueFullError(Exception):
+    pass
+
+class MicroBatcher:
+
+    def __init__(self, engine, maxBatchSize = None, batchWindow = None, queueSize = None):
+        data = {}
+        if None in (maxBatchSize, batchWindow, queueSize):
+            data = loadSettings()
+        self.engine = engine
+        # Largest number of requests forwarded together
+        self.maxBatchSize = maxBatchSize or data.get("batchSize", 8)
+        # Seconds to wait for more requests after the first one of a batch arrived
+        self.batchWindow = batchWindow if batchWindow is not None else data.get("batchWindowMs", 10) / 1000
+        self.requestQueue = queue.Queue(queueSize or data.get("requestQueueSize", 64))
+
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.images = 0
+        self.rejected = 0
+        self.failed = 0
+        self.running = True
+        self.thread = threading.Thread(target = self.run, daemon = True)
+        self.thread.start()
+
+    # Function to queue an image, returns a Future of the colorized image
+    def submit(self, image, profile = None):
+        future = Future()
+        try:
+            self.requestQueue.put_nowait((image, profile, future))
+        except queue.Full:
+            with self.lock:
+                self.rejected += 1
+            raise QueueFullError("Request queue is full")
+        return future
+
+    # Function to collect the requests arriving within the batch window
+    def collectBatch(self):
+        try:
+            batch = [self.requestQueue.get(timeout = 0.1)]
+        except queue.Empty:
+            return []
+        deadline = time.perf_counter() + self.batchWindow
+        while len(batch) < self.maxBatchSize:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.requestQueue.get(timeout = remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    # Micro-batcher thread: forward the collected requests together
+    def run(self):
+        while self.running:
+            batch = self.collectBatch()
+            # Requests of different profiles need different network input sizes
+            groups = {}
+            for request in batch:
+                groups.setdefault(request[1], []).append(request)
+            for profile, group in groups.items():
+                self.colorizeGroup(group, profile)
+
+    # Function to colorize the requests of one profile and resolve their futures
+    def colorizeGroup(self, group, profile):
+        try:
+            colorizedImages = self.engine.colorizeBatch([image for image, profile, future in group], len(group), profile)
+        except Exception as instance:
+            with self.lock:
+                self.failed += len(group)
+            for image, profile, future in group:
+                future.set_exception(instance)
+            return
+        with self.lock:
+            self.batches += 1
+            self.images += len(group)
+        for (image, profile, future), colorizedImage in zip(group, colorizedImages):
+            future.set_result(colorizedImage)
+
+    # Function to stop the micro-batcher thread
+    def close(self):
+        self.running = False
+        self.thread.join()
+
+    # Function to report the micro-batcher counters
+    def stats(self):
+        with self.lock:
+            return {
+                "batches": self.batches,
+                "images": self.images,
+                "averageBatchSize": round(self.images / self.batches, 4) if self.batches > 0 else 0.0,
+                "rejected": self.rejected,
+                "failed": self.failed,
+                "queueDepth": self.requestQueue.qsize()
+            }
+
+class ColorizationServer(ThreadingHTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, address, engine, maxConcurrentRequests = None, requestTimeout = 60, **batcherOptions):
+        super().__init__(address, ColorizationRequestHandler)
+        if maxConcurrentRequests is None:
+            maxConcurrentRequests = loadSettings().get("maxConcurrentRequests", 16)
+        self.batcher = MicroBatcher(engine, **batcherOptions)
+        # Requests over this limit are answered with 503 instead of queueing threads
+        self.requestSlots = threading.BoundedSemaphore(maxConcurrentRequests)
+        self.maxConcurrentRequests = maxConcurrentRequests
+        self.requestTimeout = requestTimeout
+        self.startTime = time.time()
+
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.busy = 0
+        self.errors = 0
+        self.latency = 0.0
+
+    # Function to record a finished request
+    def record(self, status, seconds):
+        with self.lock:
+            self.requests += 1
+            self.latency += seconds
+            if status == 503:
+                self.busy += 1
+            elif status >= 400:
+                self.errors += 1
+
+    # Function to report the service metrics
+    def metrics(self):
+        with self.lock:
+            metrics = {
+                "uptime": round(time.time() - self.startTime, 4),
+                "requests": self.requests,
+                "busy": self.busy,
+                "errors": self.errors,
+                "averageLatency": round(self.latency / self.requests, 6) if self.requests > 0 else 0.0,
+                "maxConcurrentRequests": self.maxConcurrentRequests
+            }
+        metrics["batcher"] = self.batcher.stats()
+        if self.batcher.engine.metrics.enabled:
+            metrics["engine"] = self.batcher.engine.metrics.summary()
+        return metrics
+
+    # Function to report the service metrics in the Prometheus text exposition format
+    def prometheusMetrics(self):
+        metrics = self.metrics()
+        lines = []
+        for name, value in list(metrics.items()) + [("batcher_" + key, value) for key, value in metrics["batcher"].items()]:
+            if isinstance(value, (int, float)):
+                lines.append(f"colorization_server_{name} {value}")
+        text = "\n".join(lines) + "\n"
+        if self.batcher.engine.metrics.enabled:
+            text += self.batcher.engine.metrics.toPrometheus()
+        return text
+
+    def server_close(self):
+        super().server_close()
+        self.batcher.close()
+
+class ColorizationRequestHandler(BaseHTTPRequestHandler):
+
+    # Function to send a response body
+    def respond(self, status, body, contentType = "application/json"):
+        if isinstance(body, dict):
+            body = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.status = status
+
+    def do_GET(self):
+        startTime = time.perf_counter()
+        route = urlparse(self.path).path
+        if route == "/health":
+            self.respond(200, {"status": "ok"})
+        elif route == "/metrics" and parse_qs(urlparse(self.path).query).get("format") == ["prometheus"]:
+            self.respond(200, self.server.prometheusMetrics().encode(), "text/plain; version=0.0.4")
+        elif route == "/metrics":
+            self.respond(200, self.server.metrics())
+        else:
+            self.respond(404, {"error": "Not found"})
+        self.server.record(self.status, time.perf_counter() - startTime)
+
+    def do_POST(self):
+        startTime = time.perf_counter()
+        url = urlparse(self.path)
+        if url.path != "/colorize":
+            self.respond(404, {"error": "Not found"})
+        elif not self.server.requestSlots.acquire(blocking = False):
+            self.respond(503, {"error": "Too many concurrent requests"})
+        else:
+            try:
+                self.colorize(parse_qs(url.query))
+            finally:
+                self.server.requestSlots.release()
+        self.server.record(self.status, time.perf_counter() - startTime)
+
+    # Function to decode the posted image, colorize it through the micro-batcher and send it back
+    def colorize(self, query):
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+        except ValueError:
+            length = 0
+        if length <= 0:
+            self.respond(400, {"error": "Request body must be an image with a Content-Length"})
+            return
+        body = self.rfile.read(length)
+        try:
+            image = cv.imdecode(np.frombuffer(body, "uint8"), cv.IMREAD_COLOR)
+        except cv.error:
+            image = None
+        if image is None:
+            self.respond(400, {"error": "Request body is not a supported image"})
+            return
+
+        outputFormat = query.get("format", [detectFormat(body)])[0].lower()
+        if outputFormat not in formats:
+            self.respond(400, {"error": f"Unsupported format: {outputFormat}"})
+            return
+        profile = query.get("profile", [None])[0]
+        if profile is not None and profile not in profileNames:
+            self.respond(400, {"error": f"Unknown profile: {profile}"})
+            return
+
+        try:
+            colorizedImage = self.server.batcher.submit(image, profile).result(timeout = self.server.requestTimeout)
+        except QueueFullError:
+            self.respond(503, {"error": "Request queue is full"})
+            return
+        except Exception as instance:
+            self.respond(500, {"error": str(instance)})
+            return
+
+        extension, contentType = formats[outputFormat]
+        encoded, buffer = cv.imencode(extension, colorizedImage)
+        if not encoded:
+            self.respond(500, {"error": f"Unable to encode {outputFormat}"})
+            return
+        self.respond(200, buffer.tobytes(), contentType)
+
+    # Silence the per-request log
+    def log_message(self, format, *args):
+        pass
+
+# Function to run the service until interrupted
+def serve(engine, host = "127.0.0.1", port = 8080, **serverOptions):
+    server = ColorizationServer((host, port), engine, **serverOptions)
+    print(f"Serving colorization on http://{host}:{server.server_address[1]}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
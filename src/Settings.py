@@ -0,0 +1,14 @@
+import json
+
+# Default location of the program settings
+settingsPath = "settings.json"
+
+# Function to read the program settings
+def loadSettings(filePath = settingsPath):
+    with open(filePath) as file:
+        return json.load(file)
+
+# Function to write the program settings
+def saveSettings(data, filePath = settingsPath):
+    with open(filePath, "w") as outputfile:
+        json.dump(data, outputfile)
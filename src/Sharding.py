@@ -0,0 +1,217 @@
+"""
+Multi-process video colorization by frame range
+The video is split into consecutive frame ranges which are colorized by separate worker
+processes, each holding its own network, and the segments are stitched back into the
+<name>_colorized.mp4 file. With ffmpeg available the segments are joined by stream copy
+(no re-encoding) and the audio track of the source is copied in, otherwise the segments are
+decoded and written again.
+Finished segments are recorded in a manifest, so an interrupted job resumes from the
+segments it had not finished yet.
+"""
+
+import subprocess
+import time
+from multiprocessing import Pool
+from os import path, cpu_count
+import cv2 as cv
+from .Checkpoint import SegmentManifest
+from .Encoder import encoderOptions, encoderSettings, findFFmpeg, openVideoWriter, setEncoderOptions
+from .Engine import getEngine, setDNNOptions
+from .Pipeline import VideoPipeline
+from .Temporal import TemporalColorizer
+
+# Capture wrapper stopping after a fixed number of frames
+class FrameRangeCapture:
+
+    def __init__(self, videoCapture, frameCount):
+        self.videoCapture = videoCapture
+        self.remainingFrames = frameCount
+
+    def read(self):
+        if self.remainingFrames <= 0:
+            return False, None
+        self.remainingFrames -= 1
+        return self.videoCapture.read()
+
+# Function to place the capture before the given frame
+def seekFrame(videoCapture, frameIndex):
+    if frameIndex == 0:
+        return
+    videoCapture.set(cv.CAP_PROP_POS_FRAMES, frameIndex)
+    if int(videoCapture.get(cv.CAP_PROP_POS_FRAMES)) == frameIndex:
+        return
+    # Inexact seek, skip the frames one by one from the start instead
+    videoCapture.set(cv.CAP_PROP_POS_FRAMES, 0)
+    for i in range(frameIndex):
+        if not videoCapture.grab():
+            break
+
+# Function to count the frames of a video, decoding it when the container has no frame count
+def countFrames(videoCapture):
+    frameCount = int(videoCapture.get(cv.CAP_PROP_FRAME_COUNT))
+    if frameCount > 0:
+        return frameCount
+    while videoCapture.grab():
+        frameCount += 1
+    videoCapture.set(cv.CAP_PROP_POS_FRAMES, 0)
+    return frameCount
+
+# Function to split frameCount frames into at most shards consecutive (start, end) ranges
+def splitFrameRanges(frameCount, shards):
+    shards = max(1, min(shards, frameCount))
+    bounds = [frameCount * i // shards for i in range(shards + 1)]
+    return [(bounds[i], bounds[i + 1]) for i in range(shards) if bounds[i] < bounds[i + 1]]
+
+# Function to split frameCount frames into (start, end) ranges of at most segmentFrames frames
+def splitFrameSegments(frameCount, segmentFrames):
+    return [(start, min(start + segmentFrames, frameCount)) for start in range(0, frameCount, segmentFrames)]
+
+# Function to colorize one frame range into a segment file, runs inside a worker process
+def colorizeSegment(task, engine = None):
+    inputPath, segmentFile, startFrame, endFrame, temporalMode, profile = task
+    engine = engine or getEngine()
+    colorizer = None
+    if temporalMode not in (None, "off"):
+        colorizer = TemporalColorizer(engine, temporalMode = temporalMode, profile = profile)
+
+    videoCapture = cv.VideoCapture(inputPath)
+    if not videoCapture.isOpened():
+        raise ValueError(f"Unable to read video: {inputPath}")
+    seekFrame(videoCapture, startFrame)
+    # The audio track is added once the segments are joined
+    outputVideo = openVideoWriter(segmentFile, videoCapture.get(cv.CAP_PROP_FPS),
+                                  int(videoCapture.get(cv.CAP_PROP_FRAME_WIDTH)), int(videoCapture.get(cv.CAP_PROP_FRAME_HEIGHT)))
+
+    framesWritten = []
+    try:
+        VideoPipeline(engine, colorizer = colorizer, profile = profile).run(FrameRangeCapture(videoCapture, endFrame - startFrame), outputVideo, framesWritten.append)
+    finally:
+        videoCapture.release()
+        outputVideo.release()
+    return sum(framesWritten)
+
+# Function to colorize the segment of an (index, task) pair, returns (index, frames written)
+def colorizeIndexedSegment(indexedTask):
+    index, task = indexedTask
+    return index, colorizeSegment(task)
+
+# Function to apply the DNN and encoder options of the parent process in a worker process
+def initSegmentWorker(dnnOptions, encoderOptions):
+    setDNNOptions(dnnOptions)
+    setEncoderOptions(encoderOptions)
+
+# Function to join the segment files into outputFile, returns the method used
+# audioSource is the video whose audio track is copied into outputFile, trimmed to duration seconds
+def concatenateSegments(segmentFiles, outputFile, audioSource = None, duration = None):
+    ffmpegPath = findFFmpeg()
+    if ffmpegPath is not None:
+        listFile = path.join(path.dirname(segmentFiles[0]), "segments.txt")
+        with open(listFile, "w") as outputfile:
+            for segmentFile in segmentFiles:
+                escapedPath = path.abspath(segmentFile).replace("'", "'\\''")
+                outputfile.write(f"file '{escapedPath}'\n")
+        command = [ffmpegPath, "-y", "-loglevel", "error", "-f", "concat", "-safe", "0", "-i", listFile]
+        if audioSource:
+            # Only the audio is trimmed, a shorter audio track never cuts frames of the video
+            if duration:
+                command += ["-t", f"{duration:.6f}"]
+            command += ["-i", audioSource, "-map", "0:v:0", "-map", "1:a:0?"]
+        command += ["-c", "copy", outputFile]
+        if subprocess.run(command).returncode == 0:
+            return "copy"
+
+    # Fall back to decoding the segments and writing them again
+    videoCapture = cv.VideoCapture(segmentFiles[0])
+    outputVideo = openVideoWriter(outputFile, videoCapture.get(cv.CAP_PROP_FPS),
+                                  int(videoCapture.get(cv.CAP_PROP_FRAME_WIDTH)), int(videoCapture.get(cv.CAP_PROP_FRAME_HEIGHT)), audioSource, duration)
+    videoCapture.release()
+    for segmentFile in segmentFiles:
+        videoCapture = cv.VideoCapture(segmentFile)
+        videoCapturing, videoFrame = videoCapture.read()
+        while videoCapturing:
+            outputVideo.write(videoFrame)
+            videoCapturing, videoFrame = videoCapture.read()
+        videoCapture.release()
+    outputVideo.release()
+    return "reencode"
+
+# Function to colorize a video in committed segments, returns a report
+# With jobs > 1 the segments are colorized by that many worker processes, dnnOptions (backend,
+# target, threads) are applied in every worker; with jobs = 1 they run in this process on engine.
+# segmentFrames limits the frames per segment (the work lost on interruption), shards otherwise
+# sets the number of segments. progress is called with the frames of every finished segment.
+def shardVideo(inputPath, outputPath, shards = None, jobs = None, temporalMode = None, dnnOptions = None, profile = None, segmentFrames = None, engine = None, progress = None):
+    jobs = jobs or cpu_count()
+    shards = shards or jobs
+    startTime = time.perf_counter()
+
+    videoCapture = cv.VideoCapture(inputPath)
+    if not videoCapture.isOpened():
+        raise ValueError(f"Unable to read video: {inputPath}")
+    frameCount = countFrames(videoCapture)
+    fps = videoCapture.get(cv.CAP_PROP_FPS)
+    videoCapture.release()
+    if frameCount == 0:
+        raise ValueError(f"Video has no frames: {inputPath}")
+
+    name = path.splitext(path.basename(inputPath))[0]
+    outputFile = path.join(outputPath, name + "_colorized.mp4")
+    frameRanges = splitFrameSegments(frameCount, segmentFrames) if segmentFrames else splitFrameRanges(frameCount, shards)
+    manifest = SegmentManifest(path.join(outputPath, name + "_segments"), {
+        "input": path.abspath(inputPath),
+        "size": path.getsize(inputPath),
+        "mtime": path.getmtime(inputPath),
+        "frameCount": frameCount,
+        "frameRanges": frameRanges,
+        "temporalMode": temporalMode,
+        "profile": profile,
+        # Segments of another codec can not be joined by stream copy
+        "encoder": encoderSettings()
+    })
+
+    pending = [index for index in range(len(frameRanges)) if not manifest.isCompleted(index)]
+    tasks = [(index, (inputPath, manifest.partFile(index), frameRanges[index][0], frameRanges[index][1], temporalMode, profile)) for index in pending]
+    if progress is not None:
+        progress(sum(manifest.completed.values()))
+    if jobs > 1 and len(tasks) > 1:
+        with Pool(min(jobs, len(tasks)), initializer = initSegmentWorker, initargs = (dnnOptions or {}, dict(encoderOptions))) as pool:
+            for index, frames in pool.imap_unordered(colorizeIndexedSegment, tasks, chunksize = 1):
+                manifest.commit(index, frames)
+                if progress is not None:
+                    progress(frames)
+    else:
+        setDNNOptions(dnnOptions or {})
+        for index, task in tasks:
+            frames = colorizeSegment(task, engine)
+            manifest.commit(index, frames)
+            if progress is not None:
+                progress(frames)
+
+    framesWritten = sum(manifest.completed.values())
+    if framesWritten != frameCount:
+        raise ValueError(f"Expected {frameCount} frames but colorized {framesWritten}: {inputPath}")
+
+    audioSource = inputPath if encoderSettings()["audio"] else None
+    concatenation = concatenateSegments([manifest.segmentFile(index) for index in range(len(frameRanges))], outputFile, audioSource, frameCount / fps if fps > 0 else None)
+
+    videoCapture = cv.VideoCapture(outputFile)
+    outputFrameCount = int(videoCapture.get(cv.CAP_PROP_FRAME_COUNT))
+    outputFps = videoCapture.get(cv.CAP_PROP_FPS)
+    videoCapture.release()
+    # The segments are kept, a rerun only joins them again
+    if outputFrameCount != frameCount:
+        raise ValueError(f"Expected {frameCount} frames but the joined video has {outputFrameCount}: {outputFile}")
+    manifest.remove()
+
+    return {
+        "output": outputFile,
+        "segments": len(frameRanges),
+        "segmentsResumed": len(frameRanges) - len(pending),
+        "framesInput": frameCount,
+        "framesWritten": framesWritten,
+        "framesOutput": outputFrameCount,
+        "fps": fps,
+        "outputFps": outputFps,
+        "concatenation": concatenation,
+        "seconds": round(time.perf_counter() - startTime, 4)
+    }
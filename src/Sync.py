@@ -0,0 +1,125 @@
+"""
+Incremental folder sync with a processing manifest
+The manifest in the output folder records every colorized input (relative path, size, mtime,
+optional content hash and output file) with the fingerprint of the model and the options it was
+colorized with. A sync run only colorizes new or changed inputs and reports (or prunes) the
+outputs of inputs that vanished. When nothing changed, a run is one directory walk and one
+manifest read, the model is neither loaded nor hashed.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import time
+from os import path
+from .Artifact import readArtifactHeader
+from .Cache import modelFingerprint
+
+# Name of the manifest file written into the output folder
+manifestName = ".colorization-sync.json"
+
+class SyncManifest:
+
+    # Seconds between the saves of a long run, a save rewrites every entry
+    saveInterval = 30
+
+    def __init__(self, outputFolder):
+        self.manifestFile = path.join(outputFolder, manifestName)
+        self.fingerprint = None
+        self.modelFiles = []
+        self.options = {}
+        self.entries = {}
+        # Whether the manifest differs from its file
+        self.changed = False
+        self.savedTime = time.monotonic()
+        if path.isfile(self.manifestFile):
+            with open(self.manifestFile) as file:
+                manifest = json.load(file)
+            self.fingerprint = manifest.get("fingerprint")
+            self.modelFiles = manifest.get("modelFiles", [])
+            self.options = manifest.get("options", {})
+            self.entries = manifest.get("entries", {})
+
+    # Function to write the manifest atomically
+    def save(self):
+        os.makedirs(path.dirname(self.manifestFile) or ".", exist_ok = True)
+        fileDescriptor, temporaryFile = tempfile.mkstemp(dir = path.dirname(self.manifestFile) or ".", suffix = ".tmp")
+        try:
+            with os.fdopen(fileDescriptor, "w") as outputfile:
+                json.dump({
+                    "version": 1,
+                    "fingerprint": self.fingerprint,
+                    "modelFiles": self.modelFiles,
+                    "options": self.options,
+                    "entries": self.entries
+                }, outputfile)
+            os.replace(temporaryFile, self.manifestFile)
+        except OSError:
+            if path.exists(temporaryFile):
+                os.remove(temporaryFile)
+            raise
+        self.changed = False
+        self.savedTime = time.monotonic()
+
+    # Function to save the manifest when it changed, at most every saveInterval seconds until the final save
+    def checkpoint(self, final = False):
+        if self.changed and (final or time.monotonic() - self.savedTime >= self.saveInterval):
+            self.save()
+
+# Function to return the SHA-256 of the content of a file
+def fileHash(filePath):
+    digest = hashlib.sha256()
+    with open(filePath, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# Function to walk a folder, yields (relative path, file, size, mtime in ns) of the files with the given extensions
+def scanFolder(inputFolder, extensions, recursive = True, relativeFolder = ""):
+    suffixes = tuple("." + extension.lower() for extension in extensions)
+    with os.scandir(inputFolder) as entries:
+        for entry in entries:
+            relativePath = relativeFolder + "/" + entry.name if relativeFolder else entry.name
+            if entry.is_dir():
+                if recursive:
+                    yield from scanFolder(entry.path, extensions, recursive, relativePath)
+            elif entry.name.lower().endswith(suffixes) and entry.is_file():
+                stat = entry.stat()
+                yield relativePath, entry.path, stat.st_size, stat.st_mtime_ns
+
+# Function to return the model fingerprint, only hashing the model files when their size or mtime changed
+def syncFingerprint(manifest, data):
+    if data.get("artifactFile"):
+        filePaths = [data["artifactFile"]]
+    else:
+        filePaths = [data["modelPath"], data["prototxtPath"], data["clusterPath"]]
+    modelFiles = [[filePath, path.getsize(filePath), os.stat(filePath).st_mtime_ns] for filePath in filePaths]
+    if modelFiles == manifest.modelFiles and manifest.fingerprint:
+        return manifest.fingerprint, modelFiles
+    if data.get("artifactFile"):
+        return readArtifactHeader(data["artifactFile"])["fingerprint"], modelFiles
+    return modelFingerprint(*filePaths), modelFiles
+
+# Function to compare a folder scan with the manifest
+# Returns (pending [(relative path, file, size, mtime)], unchanged count, vanished relative paths)
+def planSync(manifest, scanned, fingerprint, options, useHash = False):
+    # Another model or other options invalidate every output
+    entries = manifest.entries if (manifest.fingerprint, manifest.options) == (fingerprint, options) else {}
+    pending = []
+    unchanged = 0
+    seen = set()
+    for relativePath, inputFile, size, mtime in scanned:
+        seen.add(relativePath)
+        entry = entries.get(relativePath)
+        if entry is not None and entry["size"] == size and entry["mtime"] == mtime:
+            unchanged += 1
+        elif useHash and entry is not None and entry["size"] == size and entry.get("hash") == fileHash(inputFile):
+            # Touched but not modified
+            entry["mtime"] = mtime
+            manifest.changed = True
+            unchanged += 1
+        else:
+            pending.append((relativePath, inputFile, size, mtime))
+    vanished = sorted(relativePath for relativePath in manifest.entries if relativePath not in seen)
+    return pending, unchanged, vanished
@@ -0,0 +1,106 @@
+"""
+Temporal AB reuse for video colorization
+The CNN only runs on keyframes, chosen by a scene change test on the downscaled L channel
+and a maximum keyframe interval. Frames in between reuse the low resolution AB map of the
+previous frame, either as is or warped with the optical flow of the L channel, before it is
+upsampled onto the L channel of the new frame.
+"""
+
+import cv2 as cv
+import numpy as np
+from .Settings import loadSettings
+
+# Ways to fill the frames between keyframes
+temporalModes = ["off", "reuse", "warp"]
+
+class TemporalColorizer:
+
+    def __init__(self, engine, temporalMode = None, sceneThreshold = None, keyframeInterval = None, profile = None):
+        data = {}
+        if None in (temporalMode, sceneThreshold, keyframeInterval):
+            data = loadSettings()
+        self.engine = engine
+        self.temporalMode = temporalMode or data.get("temporalMode", "reuse")
+        if self.temporalMode not in temporalModes:
+            raise ValueError(f"Unknown temporal mode: {self.temporalMode}")
+        # Mean absolute difference of the L channel (0-100 scale) that starts a new keyframe
+        self.sceneThreshold = sceneThreshold if sceneThreshold is not None else data.get("sceneThreshold", 3.0)
+        # Maximum number of frames between two keyframes
+        self.keyframeInterval = keyframeInterval or data.get("keyframeInterval", 12)
+        # Speed/quality profile of the network input, the engine default when None
+        self.profile = profile
+
+        self.framesInferred = 0
+        self.framesReused = 0
+        self.keyframeL = None
+        self.previousL = None
+        self.previousAB = None
+        self.framesSinceKeyframe = 0
+
+    # Function to decide whether the frame needs a forward pass
+    def isKeyframe(self, L):
+        if self.temporalMode == "off" or self.keyframeL is None:
+            return True
+        if self.framesSinceKeyframe + 1 >= self.keyframeInterval:
+            return True
+        return cv.norm(L, self.keyframeL, cv.NORM_L1) / L.size > self.sceneThreshold
+
+    # Function to move the previous AB map along the optical flow between the previous and current frame
+    def warpAB(self, L):
+        previousL = cv.convertScaleAbs(self.previousL + 50, alpha = 2.55)
+        currentL = cv.convertScaleAbs(L + 50, alpha = 2.55)
+        # Flow from the current frame back to the previous frame
+        flow = cv.calcOpticalFlowFarneback(currentL, previousL, None, 0.5, 3, 15, 3, 5, 1.2, 0)
+
+        abHeight, abWidth = self.previousAB.shape[:2]
+        flow = cv.resize(flow, (abWidth, abHeight), interpolation = cv.INTER_AREA)
+        flow[:, :, 0] *= abWidth / L.shape[1]
+        flow[:, :, 1] *= abHeight / L.shape[0]
+        gridX, gridY = np.meshgrid(np.arange(abWidth, dtype = "float32"), np.arange(abHeight, dtype = "float32"))
+        return cv.remap(self.previousAB, gridX + flow[:, :, 0], gridY + flow[:, :, 1], cv.INTER_LINEAR, borderMode = cv.BORDER_REPLICATE)
+
+    # Function to colorize consecutive frames, keyframes of the batch share one forward pass
+    def colorizeBatch(self, frames, batchSize = None, profile = None):
+        profile = profile or self.profile
+        preprocessed = [self.engine.preprocess(frame, slot, profile) for slot, frame in enumerate(frames)]
+
+        # Keyframes only depend on the L channel, so they are all known before the forward pass
+        keyframes = []
+        for labImage, L in preprocessed:
+            keyframe = self.isKeyframe(L)
+            keyframes.append(keyframe)
+            if keyframe:
+                self.keyframeL = L
+                self.framesSinceKeyframe = 0
+            else:
+                self.framesSinceKeyframe += 1
+
+        keyframeLs = [L for (labImage, L), keyframe in zip(preprocessed, keyframes) if keyframe]
+        keyframeABs = []
+        batchSize = batchSize or self.engine.batchSize
+        for start in range(0, len(keyframeLs), batchSize):
+            keyframeABs.extend(self.engine.predictABBatch(keyframeLs[start:start + batchSize]))
+        keyframeABs.reverse()
+
+        colorizedImages = []
+        for (labImage, L), keyframe in zip(preprocessed, keyframes):
+            if keyframe:
+                AB_result = keyframeABs.pop()
+                self.framesInferred += 1
+            else:
+                AB_result = self.warpAB(L) if self.temporalMode == "warp" else self.previousAB
+                self.framesReused += 1
+            self.previousL = L
+            self.previousAB = AB_result
+            colorizedImages.append(self.engine.reconstruct(labImage, AB_result))
+        return colorizedImages
+
+    # Function to report how many frames were inferred and how many reused the previous AB map
+    def report(self):
+        totalFrames = self.framesInferred + self.framesReused
+        return {
+            "temporalMode": self.temporalMode,
+            "framesInferred": self.framesInferred,
+            "framesReused": self.framesReused,
+            "reuseRatio": round(self.framesReused / totalFrames, 4) if totalFrames > 0 else 0.0
+        }
@@ -0,0 +1,91 @@
+"""
+Auto-tuning of the DNN backend, target, thread count and batch size on this machine
+Every available CPU backend/target pair is measured with every thread count and batch size on
+synthetic images and the fastest configuration is written back to settings.json. When several
+worker processes share the host, thread counts are limited to the cores available per worker.
+"""
+
+import tempfile
+from os import cpu_count
+import cv2 as cv
+from .Benchmark import createEngine, environment, measure, syntheticImage
+from .Backends import backends, targets
+from .Settings import loadSettings, saveSettings
+
+# Targets running on the CPU, the ones tried by the tuner
+cpuTargets = ["cpu", "cpu_fp16"]
+
+# Function to list the (backend, target) pairs of CPU targets available in this OpenCV build
+def availableConfigurations():
+    configurations = []
+    for backend, constant in backends.items():
+        # The default backend is one of the others, measuring it again would only add noise
+        if backend == "default" or not hasattr(cv.dnn, constant):
+            continue
+        available = cv.dnn.getAvailableTargets(getattr(cv.dnn, constant))
+        for target in cpuTargets:
+            if hasattr(cv.dnn, targets[target]) and getattr(cv.dnn, targets[target]) in available:
+                configurations.append((backend, target))
+    return configurations
+
+# Function to return the thread counts worth trying for each of the given worker processes
+def threadCandidates(jobs = 1):
+    cores = max(1, (cpu_count() or 1) // max(1, jobs))
+    candidates = {cores}
+    threads = 1
+    while threads < cores:
+        candidates.add(threads)
+        threads *= 2
+    return sorted(candidates)
+
+# Function to measure every configuration, returns the report with the fastest one first
+def runTuning(network = "standin", imageSize = (640, 480), repeat = 5, jobs = 1, threadCounts = None, batchSizes = (1, 2, 4, 8, 16), workFolder = None):
+    workFolder = workFolder or tempfile.mkdtemp(prefix = "colorization_tuning_")
+    threadCounts = threadCounts or threadCandidates(jobs)
+    engine = createEngine(network, max(batchSizes), workFolder)
+    images = [syntheticImage(imageSize[0], imageSize[1], seed) for seed in range(max(batchSizes))]
+
+    results = []
+    for backend, target in availableConfigurations():
+        for threads in threadCounts:
+            engine.configure(backend, target, threads)
+            for batchSize in batchSizes:
+                try:
+                    latencies = measure(lambda: engine.colorizeBatch(images[:batchSize], batchSize), repeat)
+                except cv.error as instance:
+                    results.append({"backend": backend, "target": target, "threads": threads, "batchSize": batchSize, "error": str(instance).strip()})
+                    break
+                imagesPerSecond = batchSize * len(latencies) / sum(latencies)
+                results.append({
+                    "backend": backend,
+                    "target": target,
+                    "threads": threads,
+                    "batchSize": batchSize,
+                    "imagesPerSecond": round(imagesPerSecond, 4),
+                    # Estimate for jobs worker processes with this many threads each
+                    "hostImagesPerSecond": round(imagesPerSecond * jobs, 4)
+                })
+
+    measured = sorted((result for result in results if "error" not in result), key = lambda result: -result["imagesPerSecond"])
+    if len(measured) == 0:
+        raise RuntimeError("No DNN configuration could be measured")
+    return {
+        "network": network,
+        "imageSize": f"{imageSize[0]}x{imageSize[1]}",
+        "repeat": repeat,
+        "jobs": jobs,
+        "environment": environment(),
+        "best": measured[0],
+        "results": measured + [result for result in results if "error" in result]
+    }
+
+# Function to write the fastest configuration of a tuning report into settings.json
+def saveTuning(report):
+    best = report["best"]
+    data = loadSettings()
+    data["dnnBackend"] = best["backend"]
+    data["dnnTarget"] = best["target"]
+    data["dnnThreads"] = best["threads"]
+    data["batchSize"] = best["batchSize"]
+    saveSettings(data)
+    return data
@@ -1,2 +1,37 @@
-from .Colorization import *
-from .CLI import *
\ No newline at end of file
+import importlib
+
+# Public names and the module defining them, imported on first access so that starting the
+# batch mode does not load the interactive menu (InquirerPy) and vice versa
+_exports = {
+    "Settings": ["loadSettings", "saveSettings"],
+    "Cache": ["ResultCache", "modelFingerprint"],
+    "Encoder": ["FFmpegWriter", "openVideoWriter", "setEncoderOptions"],
+    "Sync": ["SyncManifest", "planSync", "scanFolder"],
+    "Metrics": ["Metrics", "NullMetrics"],
+    "Artifact": ["bakeArtifact", "loadArtifact"],
+    "Backends": ["InferenceBackend", "loadBackend", "registerBackend"],
+    "Engine": ["ColorizationEngine", "getEngine", "setDNNOptions"],
+    "Temporal": ["TemporalColorizer", "temporalModes"],
+    "Pipeline": ["VideoPipeline", "colorizeFrames"],
+    "LargeImage": ["colorizeLargeImage", "colorizeStrips"],
+    "Renditions": ["colorizeRenditions", "writeRenditions"],
+    "Progressive": ["colorizeProgressive", "colorizeWithPreview"],
+    "Sharding": ["shardVideo"],
+    "RawPipe": ["pipeFrames", "readRawFrames"],
+    "Live": ["LiveColorizer", "syntheticCamera"],
+    "Colorization": ["Colorization"],
+    "Server": ["ColorizationServer", "MicroBatcher", "serve"],
+    "Benchmark": ["createStandInModel", "runBenchmark"],
+    "Tuning": ["runTuning", "saveTuning"],
+    "Headless": ["runHeadless"],
+    "CLI": ["Interface"]
+}
+_modules = {name: module for module, names in _exports.items() for name in names}
+__all__ = list(_modules)
+
+def __getattr__(name):
+    if name not in _modules:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f".{_modules[name]}", __name__), name)
+    globals()[name] = value
+    return value